@@ -0,0 +1,317 @@
+"""
+    reproducible benchmark suite
+
+    replaces the timings hand-written in the module docstrings
+    ("original function: 1min 32s", "nbody_opt: 29.2s", ...), which were measured once
+    on one machine
+
+    for every case and problem size it records
+    1. cold: a fresh interpreter imports, sets up and runs the case once
+       (includes imports and JIT compilation), with its peak RSS
+    2. warm: best of --repeat in-process runs after one warm-up run,
+       with the tracemalloc peak of one run
+    and the machine info, as JSON
+
+        python benchmark.py --output results.json
+        python benchmark.py --output new.json --baseline results.json --threshold 0.2
+
+    with --baseline, warm times more than threshold (relative) slower than the baseline
+    are flagged as regressions and the exit status is 1
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+CASES = {}
+
+
+def case(name, sizes):
+    '''
+        register prepare(size) -> run() under name for the given problem sizes
+    '''
+    def decorate(prepare):
+        CASES[name] = (sizes, prepare)
+        return prepare
+    return decorate
+
+
+def _random_state(n, seed=0):
+    from nbody.initial import plummer
+    from nbody.state import solar_system
+
+    return solar_system() if n == 5 else plummer(n, seed=seed)
+
+
+def _nbody_case(backend, sizes):
+    def prepare(size):
+        from nbody import backends
+
+        (n, steps) = size
+        if not backends.is_available(backend):
+            raise ImportError('backend %s is not available' % backend)
+        state = _random_state(n)
+        return lambda: backends.run(backend, state.copy(), 1, steps, 0.001)
+    case('nbody.' + backend, sizes)(prepare)
+
+
+# (bodies, steps); the python loops are kept to sizes they finish in seconds
+_SMALL = [[5, 2000], [64, 10]]
+_LARGE = _SMALL + [[256, 10], [1024, 2]]
+for (_backend, _sizes) in (('reference', _SMALL), ('opt', _SMALL), ('iter', _SMALL),
+                           ('slots', _SMALL),
+                           ('numpy', _LARGE), ('tiled', _LARGE), ('mixed', _LARGE),
+                           ('numba', _LARGE), ('cython', _LARGE)):
+    _nbody_case(_backend, _sizes)
+
+
+def _engine_case(name, sizes):
+    # an engine outside the backend registry: prepare(state, steps) -> run()
+    def decorate(make):
+        def prepare(size):
+            (n, steps) = size
+            return make(_random_state(n), steps)
+        case('nbody.' + name, sizes)(prepare)
+        return make
+    return decorate
+
+
+@_engine_case('barneshut', _LARGE)
+def _barneshut(state, steps):
+    import nbody_barneshut
+
+    def run():
+        bodies = tuple(state.copy())
+        for _ in range(steps):
+            nbody_barneshut.advance(bodies, None, 0.001)
+    return run
+
+
+# a 64^3 mesh costs the same for any N, so it is only timed where it pays off
+@_engine_case('pm', [[1024, 2], [16384, 2]])
+def _pm(state, steps):
+    import nbody_pm
+
+    def run():
+        bodies = tuple(state.copy())
+        for _ in range(steps):
+            nbody_pm.advance(bodies, None, 0.001)
+    return run
+
+
+@_engine_case('shm', _LARGE)
+def _shm(state, steps):
+    import atexit
+    from nbody_shm import SharedSystem
+
+    # the worker pool is started once, like a warm JIT; it keeps advancing the same state
+    system = SharedSystem(tuple(state))
+    atexit.register(system.close)
+    return lambda: system.advance(steps, 0.001)
+
+
+# (members, steps) of perturbed BODIES systems
+@case('nbody.ensemble', [[100, 100], [1000, 10], [10000, 1]])
+def _ensemble(size):
+    import nbody_ensemble
+    import nbody_numpy
+
+    (members, steps) = size
+    state = _random_state(5)
+    pairs = nbody_numpy.make_pairs(5)
+
+    def run():
+        bodies = nbody_ensemble.perturbed_systems(tuple(state), members, 1e-3, seed=0)
+        for _ in range(steps):
+            nbody_ensemble.advance(bodies, pairs, 0.001)
+    return run
+
+
+@case('calculator.hypotenuse', [[100, 100], [1000, 1000], [3000, 3000]])
+def _hypotenuse(size):
+    import calculator
+
+    x = np.random.default_rng(0).random(size)
+    y = np.random.default_rng(1).random(size)
+    return lambda: calculator.hypotenuse(x, y)
+
+
+@case('binary.zbits', [[6, 3], [8, 4], [9, 3]])
+def _zbits(size):
+    import binary
+
+    def run():
+        # zbits prints its result
+        with contextlib.redirect_stdout(io.StringIO()):
+            return binary.zbits(*size)
+    return run
+
+
+def _mandel_image(mandel, height, width, iters):
+    # compute_mandel's loop over the pixels, with numpy instead of a cuda grid
+    image = np.zeros((height, width), dtype=np.uint8)
+    pixel_size_x = 3.0 / width
+    pixel_size_y = 2.0 / height
+    for x in range(width):
+        real = -2.0 + x * pixel_size_x
+        for y in range(height):
+            imag = -1.0 + y * pixel_size_y
+            image[y, x] = mandel(real, imag, iters)
+    return image
+
+
+@case('mandelbrot.python', [[64, 96], [256, 384]])
+def _mandelbrot_python(size):
+    # the python function behind the cuda device function
+    from mandelbrot_gpu import mandel
+    return lambda: _mandel_image(mandel.py_func, size[0], size[1], 20)
+
+
+@case('mandelbrot.numba', [[64, 96], [256, 384], [1024, 1536]])
+def _mandelbrot_numba(size):
+    from numba import njit
+    from mandelbrot_gpu import mandel
+
+    mandel_cpu = njit(mandel.py_func)
+    image_cpu = njit(_mandel_image)
+    return lambda: image_cpu(mandel_cpu, size[0], size[1], 20)
+
+
+def machine():
+    return {'platform': platform.platform(),
+            'machine': platform.machine(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'python': sys.version.split()[0],
+            'implementation': platform.python_implementation(),
+            'numpy': np.__version__}
+
+
+def warm(name, size, repeat=3):
+    '''
+        best of repeat in-process runs after a warm-up run, and the allocation peak of one run
+    '''
+    run = CASES[name][1](size)
+    run()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'warm': min(times), 'times': times, 'peak_bytes': peak}
+
+
+def _cold(name, size):
+    # runs in the fresh interpreter started by cold()
+    start = time.perf_counter()
+    CASES[name][1](size)()
+    elapsed = time.perf_counter() - start
+    import resource
+    return {'cold': elapsed, 'maxrss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def cold(name, size):
+    '''
+        setup and first run in a fresh interpreter, imports and JIT compilation included
+    '''
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--cold', name,
+                          '--size', json.dumps(size)],
+                         stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                         cwd=os.path.dirname(os.path.abspath(__file__)), check=True)
+    return json.loads(out.stdout.decode().splitlines()[-1])
+
+
+def run_suite(names=None, repeat=3, with_cold=True, log=sys.stderr):
+    '''
+        {'machine': ..., 'results': {name: {size: record}}}; a case that cannot be
+        prepared here (missing module or backend) is recorded as skipped with the reason
+    '''
+    results = {}
+    for name in names or CASES:
+        (sizes, _) = CASES[name]
+        results[name] = {}
+        for size in sizes:
+            key = json.dumps(size)
+            try:
+                record = warm(name, size, repeat)
+                if with_cold:
+                    record.update(cold(name, size))
+            except ImportError as err:
+                results[name][key] = {'skipped': str(err)}
+                log.write('%-24s %-12s skipped: %s\n' % (name, key, err))
+                break
+            results[name][key] = record
+            log.write('%-24s %-12s warm %.4fs%s  peak %.1f MB\n' % (
+                name, key, record['warm'],
+                '  cold %.4fs' % record['cold'] if 'cold' in record else '',
+                record['peak_bytes'] / 2 ** 20))
+    return {'machine': machine(), 'results': results}
+
+
+def compare(current, baseline, threshold=0.2):
+    '''
+        (name, size, baseline, current) for every warm time more than threshold slower
+    '''
+    regressions = []
+    for (name, sizes) in current['results'].items():
+        for (size, record) in sizes.items():
+            old = baseline['results'].get(name, {}).get(size, {})
+            if 'warm' in record and 'warm' in old and \
+                    record['warm'] > old['warm'] * (1 + threshold):
+                regressions.append((name, size, old['warm'], record['warm']))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='benchmark suite')
+    parser.add_argument('cases', nargs='*', help='case names (default all): %s' % ', '.join(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--no-cold', action='store_true', help='skip the fresh interpreter runs')
+    parser.add_argument('--output', help='write the results as JSON')
+    parser.add_argument('--baseline', help='JSON results to compare the warm times against')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown flagged as a regression (default 0.2)')
+    parser.add_argument('--cold', help=argparse.SUPPRESS)
+    parser.add_argument('--size', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.cold:
+        print(json.dumps(_cold(args.cold, json.loads(args.size))))
+        return 0
+
+    unknown = set(args.cases) - set(CASES)
+    if unknown:
+        parser.error('unknown cases: %s' % ', '.join(sorted(unknown)))
+    results = run_suite(args.cases, args.repeat, not args.no_cold)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        for (name, size, old, new) in regressions:
+            print('REGRESSION %s %s: %.4fs -> %.4fs (%+.0f%%)' % (
+                name, size, old, new, 100 * (new / old - 1)))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
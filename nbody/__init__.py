@@ -0,0 +1,17 @@
+"""
+    N-body simulation.
+
+    one entry point for all the nbody variants:
+
+        python -m nbody --backend {auto,reference,opt,iter,slots,numpy,tiled,mixed,numba,cython}
+                        --loops 100 --iterations 20000 --dt 0.01
+
+    nbody.reference is the original nbody.py; its functions are re-exported here so
+    `import nbody; nbody.nbody(100, 'sun', 20000)` keeps working
+"""
+
+from nbody.reference import BODIES, advance, report_energy, offset_momentum, nbody
+from nbody.state import State, solar_system
+from nbody.backends import register, names, get, available, fastest, run
+from nbody.initial import (load, save, generate, plummer, uniform_cube, cold_disk,
+                           solar_system_with, with_test_particles)
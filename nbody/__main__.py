@@ -0,0 +1,55 @@
+"""
+    python -m nbody: run the BODIES system on any registered backend
+"""
+
+import argparse
+import os
+import sys
+import time
+
+from nbody import backends, initial
+from nbody.state import solar_system
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m nbody', description='N-body simulation')
+    parser.add_argument('--backend', default='auto', choices=['auto'] + backends.names(),
+                        help='backend to run, auto picks the fastest available (default)')
+    parser.add_argument('--loops', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=20000)
+    parser.add_argument('--dt', type=float, default=0.01)
+    parser.add_argument('--reference', default='sun', help='body at center of system')
+    parser.add_argument('--initial', default='solar',
+                        help='initial conditions: solar (default), %s, or a .csv/.npy file'
+                        % ', '.join(initial.GENERATORS))
+    parser.add_argument('--n', type=int, default=1000, help='bodies to generate')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the generator')
+    parser.add_argument('--list', action='store_true', help='list the backends and exit')
+    args = parser.parse_args(argv)
+
+    if args.list:
+        available = backends.available()
+        for name in backends.names():
+            print('%-10s %s' % (name, 'available' if name in available else 'missing'))
+        return 0
+
+    if args.initial == 'solar':
+        state = solar_system(args.reference)
+    elif args.initial in initial.GENERATORS:
+        state = initial.generate(args.initial, args.n, args.seed)
+    elif os.path.exists(args.initial):
+        state = initial.load(args.initial)
+    else:
+        parser.error('unknown initial conditions %r' % args.initial)
+    name = backends.fastest(len(state)) if args.backend == 'auto' else args.backend
+    if not backends.is_available(name):
+        parser.error('backend %r is not available on this host' % name)
+
+    start = time.perf_counter()
+    for e in backends.run(name, state, args.loops, args.iterations, args.dt):
+        print(e)
+    sys.stderr.write('%s: %.3fs\n' % (name, time.perf_counter() - start))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+    backend registry
+
+    every backend is a run(state, loops, iterations, dt) function that advances the
+    State in place and returns the energy after every loop; a backend is available
+    when the modules it needs import on this host
+"""
+
+import importlib
+from collections import namedtuple
+from functools import partial
+from itertools import combinations
+
+Backend = namedtuple('Backend', ['name', 'modules', 'priority', 'run'])
+
+_BACKENDS = {}
+
+
+def register(name, modules, priority):
+    '''
+        decorator registering run under name
+        modules - modules that must import for the backend to be available
+        priority - higher is faster; an int or a function of the number of bodies
+    '''
+    def decorate(run):
+        _BACKENDS[name] = Backend(name, tuple(modules), priority, run)
+        return run
+    return decorate
+
+
+def names():
+    return list(_BACKENDS)
+
+
+def get(name):
+    try:
+        return _BACKENDS[name]
+    except KeyError:
+        raise ValueError('unknown backend %r, choose from %s' % (name, ', '.join(_BACKENDS)))
+
+
+def is_available(name):
+    for module in get(name).modules:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            return False
+    return True
+
+
+def available():
+    return [name for name in _BACKENDS if is_available(name)]
+
+
+def fastest(n=5):
+    '''
+        name of the fastest backend available here for n bodies
+    '''
+    def rank(name):
+        priority = _BACKENDS[name].priority
+        return priority(n) if callable(priority) else priority
+    return max(available(), key=rank)
+
+
+def run(name, state, loops, iterations, dt=0.01):
+    '''
+        run the named backend ('auto' picks the fastest) and return the energies
+    '''
+    if name == 'auto':
+        name = fastest(len(state))
+    return get(name).run(state, loops, iterations, dt)
+
+
+@register('reference', ['nbody.reference'], 10)
+def _reference(state, loops, iterations, dt):
+    from nbody import reference
+
+    saved = reference.BODIES
+    reference.BODIES = bodies = state.to_bodies()
+    energies = []
+    try:
+        for _ in range(loops):
+            for _ in range(iterations):
+                reference.advance(dt)
+            energies.append(reference.report_energy())
+    finally:
+        reference.BODIES = saved
+    state.update_from_bodies(bodies)
+    return energies
+
+
+@register('opt', ['nbody_opt'], 20)
+def _opt(state, loops, iterations, dt):
+    import nbody_opt
+
+    bodies = state.to_bodies()
+    pairs = set(combinations(bodies.keys(), 2))
+    energies = []
+    for _ in range(loops):
+        for _ in range(iterations):
+            nbody_opt.advance(bodies, pairs, dt)
+        energies.append(nbody_opt.report_energy(bodies, pairs))
+    state.update_from_bodies(bodies)
+    return energies
+
+
+@register('iter', ['nbody_iter'], 21)
+def _iter(state, loops, iterations, dt):
+    import nbody_iter
+
+    bodies = state.to_bodies()
+    pairs = set(combinations(bodies.keys(), 2))
+    energies = []
+    for _ in range(loops):
+        nbody_iter.advance(bodies, pairs, dt, iterations)
+        energies.append(nbody_iter.report_energy(bodies, pairs))
+    state.update_from_bodies(bodies)
+    return energies
+
+
+@register('slots', ['nbody_slots'], 22)
+def _slots(state, loops, iterations, dt):
+    import nbody_slots
+
+    bodies = nbody_slots.bodies_from(state.to_bodies())
+    pairs = nbody_slots.make_pairs(bodies)
+    energies = []
+    for _ in range(loops):
+        nbody_slots.advance(bodies, pairs, dt, iterations)
+        energies.append(nbody_slots.report_energy(bodies, pairs))
+    state.update_from_bodies(nbody_slots.to_dict(bodies))
+    return energies
+
+
+# per step overhead makes numpy slower than the pure python loops for a handful of bodies
+@register('numpy', ['numpy', 'nbody_numpy'], lambda n: 30 if n >= 16 else 15)
+def _numpy(state, loops, iterations, dt):
+    import nbody_numpy
+    from nbody_integrators import integrate
+
+    pairs = nbody_numpy.make_pairs(len(state))
+    energies = []
+    integrate(state, pairs, dt, loops * iterations, 'euler', nbody_numpy.accelerations,
+              lambda step, e: e is None or energies.append(float(e)), iterations)
+    return energies
+
+
+@register('tiled', ['numpy', 'nbody_tiled'], lambda n: 35 if n >= 16 else 16)
+def _tiled(state, loops, iterations, dt):
+    import nbody_tiled
+    from nbody_integrators import integrate
+
+    # the tile size saved for this host by `python nbody_tiled.py --autotune`, or TILE
+    accel = partial(nbody_tiled.accelerations, tile=nbody_tiled.tile_size())
+    energies = []
+    integrate(state, None, dt, loops * iterations, 'euler', accel,
+              lambda step, e: e is None or energies.append(float(e)), iterations)
+    return energies
+
+
+# float32 pair terms: never picked by auto, it trades accuracy for speed
+@register('mixed', ['numpy', 'nbody_mixed'], 0)
+def _mixed(state, loops, iterations, dt):
+    import nbody_mixed
+    from nbody_integrators import integrate
+
+    pairs = nbody_mixed.nbody_numpy.make_pairs(len(state))
+    energies = []
+    integrate(state, pairs, dt, loops * iterations, 'euler', nbody_mixed.accelerations,
+              lambda step, e: e is None or energies.append(float(e)), iterations)
+    return energies
+
+
+@register('numba', ['numba', 'nbody_numba'], 40)
+def _numba(state, loops, iterations, dt):
+    import nbody_numba
+
+    step = nbody_numba.advance_parallel if len(state) >= nbody_numba.PARALLEL_THRESHOLD \
+        else nbody_numba.advance
+    energies = []
+    for _ in range(loops):
+        step(state.r, state.v, state.m, iterations, dt)
+        energies.append(nbody_numba.report_energy(state.r, state.v, state.m))
+    return energies
+
+
+@register('cython', ['nbody_cython'], 50)
+def _cython(state, loops, iterations, dt):
+    import nbody_cython
+
+    step = nbody_cython.advance_parallel if len(state) >= nbody_cython.PARALLEL_THRESHOLD \
+        else nbody_cython.advance
+    energies = []
+    for _ in range(loops):
+        step(state.r, state.v, state.m, iterations, dt)
+        energies.append(nbody_cython.report_energy(state.r, state.v, state.m))
+    return energies
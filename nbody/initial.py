@@ -0,0 +1,213 @@
+"""
+    initial conditions
+
+    loaders and vectorized generators that return a State, so every backend, integrate()
+    and the array engines can take the result directly; no python loop runs per body,
+    so the generators go from 5 to 10**6 bodies
+
+    units: G = 1, as in BODIES (masses in units of 4 pi^2 solar masses)
+
+    generated systems are moved to their center-of-mass frame; bodies are named '0', '1', ...
+    (a range, so a million bodies do not cost a million strings)
+"""
+
+import os
+
+import numpy as np
+
+from nbody.state import State, solar_system
+
+COLUMNS = ('x', 'y', 'z', 'vx', 'vy', 'vz', 'm')
+
+
+def _center(state):
+    m = state.m[:, None]
+    total = state.m.sum()
+    state.r -= np.sum(state.r * m, axis=0) / total
+    state.v -= np.sum(state.v * m, axis=0) / total
+    return state
+
+
+def _state(r, v, m, names=None):
+    return State(range(len(m)) if names is None else names, r, v, m)
+
+
+def load(path):
+    '''
+        state from a .npy or .csv file
+        .npy: an (N,7) array of x, y, z, vx, vy, vz, m, or a structured array with
+              those fields (and optionally name)
+        .csv: a header line naming the columns x, y, z, vx, vy, vz, m and optionally name,
+              in any order
+    '''
+    if os.path.splitext(path)[1].lower() == '.csv':
+        data = np.genfromtxt(path, delimiter=',', names=True, dtype=None, encoding='utf-8',
+                             autostrip=True)
+        data = np.atleast_1d(data)
+    else:
+        data = np.load(path)
+    if data.dtype.names is None:
+        data = np.asarray(data, dtype=np.float64)
+        if data.ndim != 2 or data.shape[1] != len(COLUMNS):
+            raise ValueError('%s: expected an (N,7) array of %s, got shape %r' % (
+                path, ', '.join(COLUMNS), data.shape))
+        return _state(data[:, 0:3], data[:, 3:6], data[:, 6])
+
+    missing = [c for c in COLUMNS if c not in data.dtype.names]
+    if missing:
+        raise ValueError('%s: missing columns %s' % (path, ', '.join(missing)))
+    names = [str(name) for name in data['name']] if 'name' in data.dtype.names else None
+    return _state(np.stack([data['x'], data['y'], data['z']], axis=1),
+                  np.stack([data['vx'], data['vy'], data['vz']], axis=1),
+                  data['m'], names)
+
+
+def save(state, path):
+    '''
+        write the state as .npy ((N,7) float64) or .csv (with names), readable by load()
+    '''
+    table = np.column_stack([state.r, state.v, state.m])
+    if os.path.splitext(path)[1].lower() != '.csv':
+        np.save(path, table)
+        return
+    with open(path, 'w') as f:
+        f.write(','.join(('name',) + COLUMNS) + '\n')
+        for (name, row) in zip(state.names, table):
+            f.write('%s,%s\n' % (name, ','.join(repr(float(x)) for x in row)))
+
+
+def plummer(n, mass=1., scale=3. * np.pi / 16., seed=None):
+    '''
+        Plummer sphere of n equal masses in virial equilibrium
+        (Aarseth, Henon & Wielen 1974); the default scale gives virial radius 1
+    '''
+    rng = np.random.default_rng(seed)
+
+    # radius from the inverted cumulative mass, cut at 99.9% of the mass
+    x = rng.uniform(0., 0.999, n)
+    radius = scale / np.sqrt(x ** (-2. / 3.) - 1.)
+    r = radius[:, None] * _directions(rng, n)
+
+    # speed as a fraction q of the escape speed, g(q) = q^2 (1 - q^2)^3.5 by rejection
+    q = np.empty(n)
+    todo = np.arange(n)
+    while len(todo):
+        trial = rng.uniform(0., 1., len(todo))
+        accept = rng.uniform(0., 0.1, len(todo)) < trial ** 2 * (1. - trial ** 2) ** 3.5
+        q[todo[accept]] = trial[accept]
+        todo = todo[~accept]
+    escape = np.sqrt(2. * mass) * (radius ** 2 + scale ** 2) ** (-0.25)
+    v = (q * escape)[:, None] * _directions(rng, n)
+
+    return _center(_state(r, v, np.full(n, mass / n)))
+
+
+def _directions(rng, n):
+    # isotropic unit vectors
+    z = rng.uniform(-1., 1., n)
+    phi = rng.uniform(0., 2. * np.pi, n)
+    s = np.sqrt(1. - z * z)
+    return np.column_stack([s * np.cos(phi), s * np.sin(phi), z])
+
+
+def uniform_cube(n, side=1., mass=1., dispersion=0., seed=None):
+    '''
+        n equal masses uniform in a cube of the given side, with gaussian velocities of
+        the given dispersion per component (0: cold)
+    '''
+    rng = np.random.default_rng(seed)
+    r = rng.uniform(-side / 2., side / 2., (n, 3))
+    v = rng.normal(0., dispersion, (n, 3)) if dispersion else np.zeros((n, 3))
+    return _center(_state(r, v, np.full(n, mass / n)))
+
+
+def cold_disk(n, radius=1., central=1., mass=0.1, thickness=0.01, seed=None):
+    '''
+        a central body of mass `central` and n - 1 bodies of total `mass` in a disk of
+        uniform surface density out to `radius`, on circular orbits (no dispersion)
+        around the mass enclosed in their radius
+    '''
+    rng = np.random.default_rng(seed)
+    count = n - 1
+    radii = radius * np.sqrt(rng.uniform(0., 1., count))
+    phase = rng.uniform(0., 2. * np.pi, count)
+
+    r = np.zeros((n, 3))
+    r[1:, 0] = radii * np.cos(phase)
+    r[1:, 1] = radii * np.sin(phase)
+    r[1:, 2] = rng.normal(0., thickness, count)
+
+    # uniform surface density: the disk mass inside radius R is mass * (R / radius)^2
+    enclosed = central + mass * (radii / radius) ** 2
+    speed = np.sqrt(enclosed / radii)
+    v = np.zeros((n, 3))
+    v[1:, 0] = -speed * np.sin(phase)
+    v[1:, 1] = speed * np.cos(phase)
+
+    m = np.empty(n)
+    m[0] = central
+    m[1:] = mass / count if count else 0.
+    return _center(_state(r, v, m))
+
+
+def with_test_particles(bodies, count, inner=0.1, outer=40., seed=0):
+    '''
+        add count massless test particles on circular orbits around body 0,
+        with radii log-uniform between inner and outer
+    '''
+    (r, v, m) = bodies
+    rng = np.random.default_rng(seed)
+
+    radius = np.exp(rng.uniform(np.log(inner), np.log(outer), count))
+    phase = rng.uniform(0., 2. * np.pi, count)
+    speed = np.sqrt(m[0] / radius)
+
+    tr = np.zeros((count, 3))
+    tr[:, 0] = radius * np.cos(phase)
+    tr[:, 1] = radius * np.sin(phase)
+    tv = np.zeros((count, 3))
+    tv[:, 0] = -speed * np.sin(phase)
+    tv[:, 1] = speed * np.cos(phase)
+
+    return (np.concatenate([r, r[0] + tr]),
+            np.concatenate([v, v[0] + tv]),
+            np.concatenate([m, np.zeros(count)]))
+
+
+def solar_system_with(count, inner=0.1, outer=40., reference='sun', seed=None):
+    '''
+        the BODIES system plus count massless test particles on circular orbits around
+        the sun, radii log-uniform between inner and outer (see nbody_blockstep)
+    '''
+    state = solar_system(reference)
+    (r, v, m) = with_test_particles(tuple(state), count, inner, outer, seed)
+    return State(state.names + ['test%d' % k for k in range(count)], r, v, m)
+
+
+def _solar_with_test(n, seed=None):
+    # n bodies in all: the 5 of BODIES and n - 5 test particles
+    if n < 5:
+        raise ValueError('solar+test needs n >= 5 (the 5 BODIES), got %d' % n)
+    return solar_system_with(n - 5, seed=seed)
+
+
+GENERATORS = {
+    'plummer': plummer,
+    'cube': uniform_cube,
+    'disk': cold_disk,
+    'solar+test': _solar_with_test,
+}
+
+
+def generate(kind, n, seed=None):
+    '''
+        n bodies of one of GENERATORS, or the BODIES system for 'solar'
+    '''
+    if kind == 'solar':
+        return solar_system()
+    try:
+        generator = GENERATORS[kind]
+    except KeyError:
+        raise ValueError('unknown initial conditions %r, choose from solar, %s' % (
+            kind, ', '.join(GENERATORS)))
+    return generator(n, seed=seed)
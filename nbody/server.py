@@ -0,0 +1,340 @@
+"""
+    local simulation job server
+
+        python -m nbody.server serve [--socket PATH | --port PORT] [--workers N]
+        python -m nbody.server submit [--socket PATH | --port PORT] --backend numba --loops 10
+        python -m nbody.server status [--socket PATH | --port PORT]
+
+    1. the protocol is newline-delimited JSON over a Unix socket (or TCP on localhost):
+       a request line {"op": "submit", "spec": {...}}, {"op": "watch", "job": id} or
+       {"op": "status"}, and one JSON line per event in response
+    2. a spec takes the options of python -m nbody: backend, loops, iterations, dt,
+       reference, initial, n, seed; submitted jobs wait in a FIFO queue
+    3. jobs run on a process pool whose workers import every available backend and run
+       it once when they start, on the 5 body system and, for the backends that switch to
+       a parallel kernel above PARALLEL_THRESHOLD bodies (numba, cython), on that many
+       bodies too, so JIT compilation and extension loading are paid once per worker, not
+       once per job and not on the first large job; one dispatcher per worker takes the
+       next job as soon as its worker is free, so the queue keeps every worker busy
+    4. workers report every loop's energy through a multiprocessing queue; the server
+       streams {"job", "event": "queued" | "started" | "progress" | "done" | "error", ...}
+       to the client that submitted the job and to anyone watching it, replaying the
+       events so far to late watchers; the events of the last `keep` finished jobs are
+       kept, older ones are forgotten
+"""
+
+import argparse
+import asyncio
+import itertools
+import collections
+import json
+import math
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from nbody import backends
+
+DEFAULT_SOCKET = os.path.join(tempfile.gettempdir(), 'nbody-%d.sock' % os.getuid())
+
+DEFAULT_SPEC = {'backend': 'auto', 'loops': 100, 'iterations': 20000, 'dt': 0.01,
+                'reference': 'sun', 'initial': 'solar', 'n': 1000, 'seed': None}
+
+_events = None
+
+
+def _warm(events):
+    # pool initializer: keep the event queue and compile / load every backend once;
+    # ctrl-c is for the server, which shuts the pool down
+    global _events
+    _events = events
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from nbody.initial import plummer
+    from nbody.state import solar_system
+    for name in backends.available():
+        backends.run(name, solar_system(), 1, 1)
+        # the large-N kernel of the backend, if it has one
+        for module in backends.get(name).modules:
+            threshold = getattr(sys.modules.get(module), 'PARALLEL_THRESHOLD', None)
+            if threshold:
+                backends.run(name, plummer(threshold, seed=0), 1, 1)
+
+
+def validate(spec):
+    '''
+        the spec completed with the defaults; ValueError when it is not runnable
+    '''
+    from nbody import initial
+
+    if not isinstance(spec, dict):
+        raise ValueError('spec must be an object')
+    unknown = set(spec) - set(DEFAULT_SPEC)
+    if unknown:
+        raise ValueError('unknown spec keys: %s' % ', '.join(sorted(unknown)))
+    spec = dict(DEFAULT_SPEC, **spec)
+    if spec['backend'] != 'auto':
+        backends.get(spec['backend'])
+    if spec['initial'] != 'solar' and spec['initial'] not in initial.GENERATORS and \
+            not os.path.exists(spec['initial']):
+        raise ValueError('unknown initial conditions %r' % spec['initial'])
+    for key in ('loops', 'iterations', 'n'):
+        if not isinstance(spec[key], int) or isinstance(spec[key], bool) or spec[key] < 1:
+            raise ValueError('%s must be a positive integer' % key)
+    dt = spec['dt']
+    if not isinstance(dt, (int, float)) or isinstance(dt, bool) or \
+            not math.isfinite(dt) or dt <= 0:
+        raise ValueError('dt must be a positive number')
+    seed = spec['seed']
+    if seed is not None and (not isinstance(seed, int) or isinstance(seed, bool) or seed < 0):
+        raise ValueError('seed must be a non-negative integer or null')
+    if not isinstance(spec['reference'], str):
+        raise ValueError('reference must be a body name')
+    return spec
+
+
+def run_job(job, spec):
+    '''
+        run a spec in a worker, reporting (job, event) through the event queue;
+        the last event is done or error
+    '''
+    try:
+        _events.put((job, _run(job, spec)))
+    except Exception as err:
+        _events.put((job, {'event': 'error', 'error': '%s: %s' % (type(err).__name__, err)}))
+
+
+def _run(job, spec):
+    from nbody import initial
+    from nbody.state import solar_system
+
+    if spec['initial'] == 'solar':
+        state = solar_system(spec['reference'])
+    elif spec['initial'] in initial.GENERATORS:
+        state = initial.generate(spec['initial'], spec['n'], spec['seed'])
+    else:
+        state = initial.load(spec['initial'])
+    name = backends.fastest(len(state)) if spec['backend'] == 'auto' else spec['backend']
+    if not backends.is_available(name):
+        raise ValueError('backend %r is not available on this host' % name)
+
+    _events.put((job, {'event': 'started', 'backend': name, 'bodies': len(state),
+                       'pid': os.getpid()}))
+    start = time.perf_counter()
+    energies = []
+    for loop in range(spec['loops']):
+        (e,) = backends.run(name, state, 1, spec['iterations'], spec['dt'])
+        energies.append(float(e))
+        _events.put((job, {'event': 'progress', 'loop': loop + 1, 'loops': spec['loops'],
+                           'energy': float(e)}))
+    return {'event': 'done', 'seconds': time.perf_counter() - start, 'energies': energies}
+
+
+class JobServer(object):
+    '''
+        queue of jobs run by a warm process pool, with per job event streams
+        keep - number of finished jobs whose events are kept for watch and status
+    '''
+
+    def __init__(self, workers=None, keep=1000):
+        self.workers = workers or os.cpu_count() or 1
+        self.keep = keep
+        self.finished = collections.deque()
+        self.ids = itertools.count(1)
+        self.queue = asyncio.Queue()
+        self.history = {}
+        self.watchers = {}
+        self.running = 0
+        self.events = multiprocessing.get_context('spawn').Queue()
+        self.pool = ProcessPoolExecutor(self.workers, multiprocessing.get_context('spawn'),
+                                        initializer=_warm, initargs=(self.events,))
+
+    def publish(self, job, event):
+        event = dict(event, job=job)
+        self.history[job].append(event)
+        for watcher in self.watchers[job]:
+            watcher.put_nowait(event)
+        if event['event'] in ('done', 'error'):
+            self.finished.append(job)
+            while len(self.finished) > self.keep:
+                old = self.finished.popleft()
+                del self.history[old], self.watchers[old]
+
+    def _forward(self, loop):
+        # thread: worker events -> event loop
+        while True:
+            item = self.events.get()
+            if item is None:
+                return
+            loop.call_soon_threadsafe(self.publish, *item)
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            (job, spec) = await self.queue.get()
+            self.running += 1
+            try:
+                # the job's events, done or error included, come through self.events
+                await loop.run_in_executor(self.pool, run_job, job, spec)
+            except Exception as err:
+                # the worker died (BrokenProcessPool)
+                self.publish(job, {'event': 'error',
+                                   'error': '%s: %s' % (type(err).__name__, err)})
+            finally:
+                self.running -= 1
+
+    def submit(self, spec):
+        job = next(self.ids)
+        self.history[job] = []
+        self.watchers[job] = set()
+        self.queue.put_nowait((job, spec))
+        self.publish(job, {'event': 'queued', 'position': self.queue.qsize(), 'spec': spec})
+        return job
+
+    async def watch(self, job, writer):
+        '''
+            stream the events of job to writer until it is done
+        '''
+        watcher = asyncio.Queue()
+        for event in self.history[job]:
+            watcher.put_nowait(event)
+        self.watchers[job].add(watcher)
+        try:
+            while True:
+                event = await watcher.get()
+                writer.write((json.dumps(event) + '\n').encode())
+                await writer.drain()
+                if event['event'] in ('done', 'error'):
+                    return
+        finally:
+            # the job may have been forgotten meanwhile
+            self.watchers.get(job, set()).discard(watcher)
+
+    async def handle(self, reader, writer):
+        try:
+            request = json.loads(await reader.readline())
+            if not isinstance(request, dict):
+                raise ValueError('request must be an object')
+            op = request.get('op')
+            if op == 'submit':
+                await self.watch(self.submit(validate(request.get('spec', {}))), writer)
+            elif op == 'watch':
+                if request.get('job') not in self.history:
+                    raise ValueError('unknown job %r' % request.get('job'))
+                await self.watch(request['job'], writer)
+            elif op == 'status':
+                status = {'workers': self.workers, 'running': self.running,
+                          'queued': self.queue.qsize(),
+                          'jobs': {job: events[-1]['event'] for (job, events) in
+                                   self.history.items()}}
+                writer.write((json.dumps(status) + '\n').encode())
+            else:
+                raise ValueError('unknown op %r' % op)
+        except (ValueError, KeyError, TypeError) as err:
+            # TypeError: a field of the wrong JSON type, e.g. an unhashable job
+            writer.write((json.dumps({'event': 'error', 'error': str(err)}) + '\n').encode())
+        except ConnectionError:
+            pass
+        finally:
+            try:
+                await writer.drain()
+                writer.close()
+            except ConnectionError:
+                pass
+
+    async def serve(self, path=None, port=None):
+        loop = asyncio.get_running_loop()
+        threading.Thread(target=self._forward, args=(loop,), daemon=True).start()
+        # start and warm every worker before accepting jobs
+        await asyncio.gather(*[loop.run_in_executor(self.pool, os.getpid)
+                               for _ in range(self.workers)])
+        dispatchers = [asyncio.ensure_future(self._dispatch()) for _ in range(self.workers)]
+        if port is not None:
+            server = await asyncio.start_server(self.handle, '127.0.0.1', port)
+        else:
+            if os.path.exists(path):
+                os.unlink(path)
+            server = await asyncio.start_unix_server(self.handle, path)
+        sys.stderr.write('nbody job server: %d workers on %s\n' % (
+            self.workers, 'port %d' % port if port is not None else path))
+        # `kill` stops the server like ctrl-c: without the pool shutdown below the workers
+        # would outlive it
+        stop = loop.create_future()
+        loop.add_signal_handler(signal.SIGTERM, stop.set_result, None)
+        try:
+            async with server:
+                await stop
+        finally:
+            loop.remove_signal_handler(signal.SIGTERM)
+            for dispatcher in dispatchers:
+                dispatcher.cancel()
+            self.events.put(None)
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            if port is None and os.path.exists(path):
+                os.unlink(path)
+
+
+def request(message, path=None, port=None):
+    '''
+        send one request and yield the JSON lines of the response as they arrive
+    '''
+    if port is not None:
+        sock = socket.create_connection(('127.0.0.1', port))
+    else:
+        sock = socket.socket(socket.AF_UNIX)
+        sock.connect(path)
+    with sock, sock.makefile('rwb') as f:
+        f.write((json.dumps(message) + '\n').encode())
+        f.flush()
+        for line in f:
+            yield json.loads(line)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m nbody.server',
+                                     description='local N-body job server')
+    parser.add_argument('command', choices=['serve', 'submit', 'watch', 'status'])
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='unix socket path')
+    parser.add_argument('--port', type=int, default=None, help='TCP port on localhost instead')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (serve)')
+    parser.add_argument('--keep', type=int, default=1000,
+                        help='finished jobs whose events are kept (serve)')
+    parser.add_argument('--job', type=int, help='job to watch')
+    for (key, default) in DEFAULT_SPEC.items():
+        parser.add_argument('--' + key, type=type(default) if default is not None else int,
+                            default=default)
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        try:
+            asyncio.run(JobServer(args.workers, args.keep).serve(args.socket, args.port))
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    if args.command == 'submit':
+        message = {'op': 'submit', 'spec': {key: getattr(args, key) for key in DEFAULT_SPEC}}
+    elif args.command == 'watch':
+        message = {'op': 'watch', 'job': args.job}
+    else:
+        message = {'op': 'status'}
+    status = 0
+    for event in request(message, args.socket, args.port):
+        if event.get('event') == 'progress':
+            print(event['energy'])
+        elif event.get('event') == 'done':
+            sys.stderr.write('job %d: %.3fs\n' % (event['job'], event['seconds']))
+        elif event.get('event') == 'error':
+            sys.stderr.write('error: %s\n' % event['error'])
+            status = 1
+        elif args.command == 'status' or event.get('event') != 'queued':
+            print(json.dumps(event))
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
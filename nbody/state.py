@@ -0,0 +1,74 @@
+"""
+    state object shared by every backend
+"""
+
+import numpy as np
+
+
+class State(object):
+    '''
+        names and (r, v, m) float64 arrays of a system
+        iterating over a State yields r, v and m, so it can be passed wherever the
+        array engines expect a (r, v, m) tuple
+    '''
+
+    def __init__(self, names, r, v, m):
+        # a range stands for the names 0 .. N-1 without a list of N objects
+        self.names = names if isinstance(names, range) else list(names)
+        self.r = np.ascontiguousarray(r, dtype=np.float64)
+        self.v = np.ascontiguousarray(v, dtype=np.float64)
+        self.m = np.ascontiguousarray(m, dtype=np.float64)
+
+    def __iter__(self):
+        return iter((self.r, self.v, self.m))
+
+    def __len__(self):
+        return len(self.m)
+
+    @classmethod
+    def from_bodies(cls, bodies):
+        '''
+            state from a BODIES style dict of (position, velocity, mass)
+        '''
+        names = list(bodies.keys())
+        return cls(names,
+                   [bodies[name][0] for name in names],
+                   [bodies[name][1] for name in names],
+                   [bodies[name][2] for name in names])
+
+    def to_bodies(self):
+        '''
+            BODIES style dict of ([x, y, z], [vx, vy, vz], m) with fresh lists
+        '''
+        return {name: (list(map(float, self.r[k])), list(map(float, self.v[k])), float(self.m[k]))
+                for (k, name) in enumerate(self.names)}
+
+    def update_from_bodies(self, bodies):
+        '''
+            copy positions and velocities back from a BODIES style dict
+        '''
+        for (k, name) in enumerate(self.names):
+            self.r[k] = bodies[name][0]
+            self.v[k] = bodies[name][1]
+
+    def copy(self):
+        return State(self.names, self.r.copy(), self.v.copy(), self.m.copy())
+
+    def offset_momentum(self, reference):
+        '''
+            give the reference body the momentum that makes the total zero
+        '''
+        ref = self.names.index(reference) if isinstance(reference, str) else reference
+        p = -np.sum(self.v * self.m[:, None], axis=0)
+        self.v[ref] = p / self.m[ref]
+
+
+def solar_system(reference='sun'):
+    '''
+        the five body BODIES system with its momentum offset to the reference body
+    '''
+    from nbody.reference import BODIES
+
+    state = State.from_bodies(BODIES)
+    state.offset_momentum(reference)
+    return state
@@ -0,0 +1,250 @@
+"""
+    N-body simulation.
+
+    Barnes-Hut tree code for large N
+
+    1. an octree of array-backed nodes (center, half width, particle range, children,
+       mass, center of mass) is rebuilt level by level every step
+    2. the tree walk is vectorized over (particle, node) pairs instead of recursing per particle
+    3. a node is used as a point mass when size / distance < theta, so theta trades accuracy
+       for speed (theta = 0 opens every node and gives back direct summation)
+    4. advance keeps the advance(bodies, pairs, dt) contract of nbody_numpy; pairs is unused
+"""
+
+import time
+
+import numpy as np
+
+import nbody_numpy
+
+MAX_DEPTH = 32
+CHUNK = 4096
+
+
+def build_tree(r, m, leaf_size=8):
+    '''
+        build an octree over the positions r
+        returns a dict of node arrays; node 0 is the root and nodes of the same
+        level have contiguous ids, children are -1 when empty
+    '''
+    n = len(m)
+    order = np.arange(n)
+
+    lo = r.min(axis=0)
+    hi = r.max(axis=0)
+    root_half = max(float(np.max(hi - lo)) / 2., 1e-12) * (1. + 1e-9)
+
+    centers = ((lo + hi) / 2.)[None, :]
+    halves = np.array([root_half])
+    starts = np.array([0])
+    counts = np.array([n])
+    levels = [(0, 1)]
+    child = np.full((1, 8), -1, dtype=np.intp)
+
+    frontier = np.array([0])
+    next_id = 1
+    depth = 0
+    while frontier.size and depth < MAX_DEPTH:
+        split = frontier[counts[frontier] > leaf_size]
+        if not split.size:
+            break
+
+        ########### sort particles into octants #############
+        seg_counts = counts[split]
+        offs = np.cumsum(seg_counts) - seg_counts
+        total = int(seg_counts.sum())
+        seg = np.repeat(np.arange(len(split)), seg_counts)
+        slots = np.repeat(starts[split] - offs, seg_counts) + np.arange(total)
+        p = order[slots]
+
+        c = centers[split][seg]
+        octant = ((r[p, 0] > c[:, 0]).astype(np.intp)
+                  | ((r[p, 1] > c[:, 1]).astype(np.intp) << 1)
+                  | ((r[p, 2] > c[:, 2]).astype(np.intp) << 2))
+        key = seg * 8 + octant
+        order[slots] = p[np.argsort(key, kind='stable')]
+        ################## end ##############################
+
+        ########### create children ###########
+        kc = np.bincount(key, minlength=8 * len(split))
+        kstart = np.repeat(starts[split] - offs, 8) + np.cumsum(kc) - kc
+        ks = np.nonzero(kc)[0]
+        parent = split[ks // 8]
+        octant = ks % 8
+
+        new_ids = next_id + np.arange(len(ks))
+        new_half = halves[parent] / 2.
+        sign = ((octant[:, None] >> np.arange(3)) & 1) * 2. - 1.
+
+        centers = np.concatenate([centers, centers[parent] + sign * new_half[:, None]])
+        halves = np.concatenate([halves, new_half])
+        starts = np.concatenate([starts, kstart[ks]])
+        counts = np.concatenate([counts, kc[ks]])
+        child = np.concatenate([child, np.full((len(ks), 8), -1, dtype=np.intp)])
+        child[parent, octant] = new_ids
+        ############# end #####################
+
+        levels.append((next_id, next_id + len(ks)))
+        next_id += len(ks)
+        frontier = new_ids
+        depth += 1
+
+    leaf = child.max(axis=1) < 0
+
+    ########### mass and center of mass, bottom up ###########
+    mass = np.zeros(next_id)
+    mr = np.zeros((next_id, 3))
+    leaves = np.nonzero(leaf)[0]
+    leaves = leaves[np.argsort(starts[leaves])]
+    mo = m[order]
+    mass[leaves] = np.add.reduceat(mo, starts[leaves])
+    mr[leaves] = np.add.reduceat(mo[:, None] * r[order], starts[leaves])
+
+    for (first, last) in reversed(levels):
+        ids = np.arange(first, last)
+        ids = ids[~leaf[ids]]
+        if not ids.size:
+            continue
+        ch = child[ids]
+        valid = ch >= 0
+        mass[ids] = np.where(valid, mass[ch], 0.).sum(axis=1)
+        mr[ids] = np.where(valid[:, :, None], mr[ch], 0.).sum(axis=1)
+
+    com = centers.copy()
+    massive = mass > 0
+    com[massive] = mr[massive] / mass[massive, None]
+    ###################### end ###############################
+
+    return {'order': order, 'center': centers, 'half': halves, 'start': starts,
+            'count': counts, 'child': child, 'leaf': leaf, 'mass': mass, 'com': com}
+
+
+def _walk(tree, r, m, targets, theta, eps):
+    '''
+        accelerations on the bodies in targets from a single vectorized tree walk
+    '''
+    order = tree['order']
+    center = tree['center']
+    half = tree['half']
+    start = tree['start']
+    count = tree['count']
+    child = tree['child']
+    leaf = tree['leaf']
+    mass = tree['mass']
+    com = tree['com']
+
+    nt = len(targets)
+    a = np.zeros((nt, 3))
+    eps2 = eps * eps
+    theta2 = theta * theta
+
+    tp = np.arange(nt)
+    nd = np.zeros(nt, dtype=np.intp)
+    while tp.size:
+        x = r[targets[tp]]
+        d = com[nd] - x
+        d2 = np.einsum('ij,ij->i', d, d)
+        size = 2. * half[nd]
+        inside = np.all(np.abs(x - center[nd]) <= half[nd][:, None], axis=1)
+        far = (size * size < theta2 * d2) & ~inside
+
+        ########### node as a point mass ###########
+        if far.any():
+            mag = mass[nd[far]] * (d2[far] + eps2) ** (-1.5)
+            for k in range(3):
+                a[:, k] += np.bincount(tp[far], weights=d[far, k] * mag, minlength=nt)
+        ################### end ####################
+
+        ########### direct sum over leaf bodies ###########
+        direct = ~far & leaf[nd]
+        if direct.any():
+            cnt = count[nd[direct]]
+            offs = np.cumsum(cnt) - cnt
+            q_tp = np.repeat(tp[direct], cnt)
+            q = order[np.repeat(start[nd[direct]] - offs, cnt) + np.arange(int(cnt.sum()))]
+            keep = q != targets[q_tp]
+            q_tp = q_tp[keep]
+            q = q[keep]
+
+            dq = r[q] - r[targets[q_tp]]
+            mag = m[q] * (np.einsum('ij,ij->i', dq, dq) + eps2) ** (-1.5)
+            for k in range(3):
+                a[:, k] += np.bincount(q_tp, weights=dq[:, k] * mag, minlength=nt)
+        ####################### end #######################
+
+        ########### open the remaining nodes ###########
+        opened = ~far & ~leaf[nd]
+        ch = child[nd[opened]].ravel()
+        valid = ch >= 0
+        tp = np.repeat(tp[opened], 8)[valid]
+        nd = ch[valid]
+        ###################### end #####################
+
+    return a
+
+
+def accelerations(bodies, pairs=None, theta=0.5, eps=0.0, leaf_size=8):
+    '''
+        compute the acceleration of every body with a freshly built octree
+    '''
+    (r, v, m) = bodies
+    tree = build_tree(r, m, leaf_size)
+
+    n = len(m)
+    a = np.empty_like(r)
+    for first in range(0, n, CHUNK):
+        targets = np.arange(first, min(first + CHUNK, n))
+        a[targets] = _walk(tree, r, m, targets, theta, eps)
+    return a
+
+
+def advance(bodies, pairs, dt, theta=0.5, eps=0.0, leaf_size=8):
+    '''
+        advance the system one timestep
+    '''
+    (r, v, m) = bodies
+
+    ########### update_vs ###########
+    v += dt * accelerations(bodies, pairs, theta, eps, leaf_size)
+    ############# end ###############
+
+    ########### update_rs #############
+    r += dt * v
+    ############## end ################
+
+
+def benchmark(sizes=(256, 512, 1024, 2048, 4096), theta=0.5, repeat=3, seed=0):
+    '''
+        time one force evaluation of direct summation (nbody_numpy) against
+        Barnes-Hut for a uniform cube of N equal masses and report the crossover N
+        direct summation materializes all N*(N-1)/2 pairs, so keep sizes modest
+    '''
+    rng = np.random.default_rng(seed)
+    print('%8s %12s %12s %10s %12s' % ('N', 'direct (s)', 'tree (s)', 'speedup', 'median err'))
+
+    crossover = None
+    for n in sizes:
+        r = rng.uniform(-1., 1., (n, 3))
+        bodies = (r, np.zeros_like(r), np.full(n, 1. / n))
+        pairs = nbody_numpy.make_pairs(n)
+
+        t_direct = t_tree = float('inf')
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            a_direct = nbody_numpy.accelerations(bodies, pairs)
+            t1 = time.perf_counter()
+            a_tree = accelerations(bodies, theta=theta)
+            t2 = time.perf_counter()
+            t_direct = min(t_direct, t1 - t0)
+            t_tree = min(t_tree, t2 - t1)
+
+        err = np.median(np.linalg.norm(a_tree - a_direct, axis=1) / np.linalg.norm(a_direct, axis=1))
+        print('%8d %12.4f %12.4f %10.2f %12.2e' % (n, t_direct, t_tree, t_direct / t_tree, err))
+        if crossover is None and t_tree < t_direct:
+            crossover = n
+
+    print('crossover N (theta=%g): %s' % (theta, crossover if crossover else '> %d' % sizes[-1]))
+    return crossover
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,196 @@
+"""
+    N-body simulation.
+
+    content-addressed on-disk cache of simulation results
+
+    1. a run is identified by the sha256 of its initial r, v, m bytes, the integrator, dt,
+       the energy cadence and the engine: the accel function's name, its parameters (for
+       an engine object such as a NeighbourList its configuration too) and a hash of the
+       source of its module and of nbody_integrators, so editing the engine invalidates
+       its results
+    2. an entry is <run key>-<steps>.npz holding the final r, v, m and the energy every
+       `every` steps; entries are written to a temporary file and renamed into place
+    3. a request for more steps than are cached starts from the longest cached prefix of
+       the same run and only integrates the new steps; integrate() recomputes the
+       accelerations from r at the start of every call, so the result is bit for bit the
+       one of a single uninterrupted run (see nbody_checkpoint); engine objects with
+       state of their own (a NeighbourList would rebuild on a different schedule) are
+       always run from the start, so every entry is a bit for bit uninterrupted run
+    4. hits touch the entry's mtime; when the directory grows beyond max_bytes the least
+       recently used entries are deleted
+
+        cache = ResultCache('.nbody-cache')
+        (bodies, energies) = cache.run(bodies, pairs, dt, steps, 'leapfrog', accelerations,
+                                       every=1000)
+"""
+
+import functools
+import hashlib
+import inspect
+import os
+import re
+import sys
+import tempfile
+
+import numpy as np
+
+_ENTRY = re.compile(r'^([0-9a-f]{64})-(\d+)\.npz$')
+
+
+def engine_version(accel, params=()):
+    '''
+        string identifying the engine: accel's module and name, its parameters and
+        the sha256 of the source of its module and of nbody_integrators
+    '''
+    import nbody_integrators
+
+    if isinstance(accel, functools.partial):
+        params = tuple(params) + tuple(sorted(accel.keywords.items())) + accel.args
+        accel = accel.func
+    target = accel if inspect.isfunction(accel) or inspect.ismethod(accel) else type(accel)
+    if target is not accel:
+        # an engine object: its own configuration, or its public attributes
+        config = getattr(accel, 'config', None)
+        if config is None:
+            config = tuple(sorted((k, x) for (k, x) in getattr(accel, '__dict__', {}).items()
+                                  if not k.startswith('_') and not callable(x)))
+        params = tuple(params) + tuple(config)
+    module = sys.modules.get(getattr(target, '__module__', None))
+    digest = hashlib.sha256()
+    for source in (module, nbody_integrators):
+        try:
+            digest.update(inspect.getsource(source).encode())
+        except (OSError, TypeError):
+            # compiled modules (nbody_cython) have no source, use their file
+            with open(source.__file__, 'rb') as f:
+                digest.update(f.read())
+    return '%s.%s%r@%s' % (getattr(target, '__module__', '?'),
+                           getattr(target, '__qualname__', '?'),
+                           tuple(params), digest.hexdigest()[:16])
+
+
+def _stateless(accel):
+    # a plain function (or a partial of one) starts every call from r alone
+    while isinstance(accel, functools.partial):
+        accel = accel.func
+    return inspect.isfunction(accel) or inspect.isbuiltin(accel)
+
+
+def run_key(bodies, integrator, dt, every, engine):
+    '''
+        sha256 of the initial state and everything that determines the run but its length
+    '''
+    digest = hashlib.sha256()
+    for x in bodies:
+        x = np.ascontiguousarray(x, dtype=np.float64)
+        digest.update(repr(x.shape).encode())
+        digest.update(x.tobytes())
+    digest.update(repr((integrator, float(dt).hex(), int(every), engine)).encode())
+    return digest.hexdigest()
+
+
+class ResultCache(object):
+    '''
+        directory of cached runs, at most max_bytes large (default 1 GiB)
+    '''
+
+    def __init__(self, directory, max_bytes=2 ** 30):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.steps_run = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key, steps):
+        return os.path.join(self.directory, '%s-%d.npz' % (key, steps))
+
+    def _entries(self):
+        for name in os.listdir(self.directory):
+            match = _ENTRY.match(name)
+            if match:
+                yield (match.group(1), int(match.group(2)), os.path.join(self.directory, name))
+
+    def longest_prefix(self, key, steps, every=0):
+        '''
+            the largest cached step count <= steps of the run key (0 if none); with an
+            energy cadence only prefixes on its grid count
+        '''
+        best = 0
+        for (k, s, _) in self._entries():
+            if k == key and best < s <= steps and (not every or s % every == 0):
+                best = s
+        return best
+
+    def load(self, key, steps):
+        '''
+            ((r, v, m), energies) of a cached entry; touches it for LRU
+        '''
+        path = self._path(key, steps)
+        with np.load(path) as data:
+            result = ((data['r'], data['v'], data['m']), [float(e) for e in data['energies']])
+        os.utime(path)
+        return result
+
+    def store(self, key, steps, bodies, energies):
+        (r, v, m) = bodies
+        (fd, tmp) = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez(f, r=r, v=v, m=m, energies=np.asarray(energies, dtype=np.float64))
+            os.replace(tmp, self._path(key, steps))
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        '''
+            delete least recently used entries until the cache fits max_bytes
+        '''
+        entries = []
+        for (_, _, path) in self._entries():
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, path))
+        total = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def run(self, bodies, pairs, dt, steps, integrator, accel, every=0, params=()):
+        '''
+            the final (r, v, m) and the energies every `every` steps of integrating bodies
+            (not modified) steps steps, from the cache or from the longest cached prefix
+            params - accel's parameters, part of the key (e.g. eps and cutoff)
+        '''
+        from nbody_integrators import integrate
+
+        key = run_key(bodies, integrator, dt, every, engine_version(accel, params))
+        done = self.longest_prefix(key, steps, every)
+        if done != steps and not _stateless(accel):
+            done = 0
+        if done == steps and steps:
+            self.hits += 1
+            return self.load(key, steps)
+
+        self.misses += 1
+        if done:
+            (state, energies) = self.load(key, done)
+            state = tuple(np.array(x) for x in state)
+        else:
+            state = tuple(np.array(x, dtype=np.float64) for x in bodies)
+            energies = []
+
+        integrate(state, pairs, dt, steps - done, integrator, accel,
+                  lambda step, e: e is None or energies.append(float(e)), every)
+        self.steps_run += steps - done
+        self.store(key, steps, state, energies)
+        return state, energies
@@ -0,0 +1,89 @@
+"""
+    N-body simulation.
+
+    memory-mapped checkpoints for long runs
+
+    1. a checkpoint file is a single numpy.memmap record: a header and two slots, each
+       slot holding the step and loop counters, dt, the integrator name and the
+       r, v and m arrays as raw float64
+    2. saving copies the arrays into the inactive slot, flushes it, then flips the active
+       slot in the header and flushes again, so a job killed mid-save leaves the previous
+       checkpoint intact
+    3. no pickling or formatting is involved, a checkpoint is two memcpy's and a flush
+    4. the integrators recompute accelerations at the start of every integrate() call, so
+       (r, v, dt, integrator) is the complete integrator state at a loop boundary and
+       a resumed run continues bit for bit
+"""
+
+import numpy as np
+
+MAGIC = b'NBODYCK1'
+
+_HEADER = np.dtype([('magic', 'S8'), ('n', '<i8'), ('active', '<i8')])
+
+
+def _dtype(n):
+    slot = np.dtype([('step', '<i8'), ('loop', '<i8'), ('dt', '<f8'), ('integrator', 'S16'),
+                     ('r', '<f8', (n, 3)), ('v', '<f8', (n, 3)), ('m', '<f8', (n,))])
+    return np.dtype([('magic', 'S8'), ('n', '<i8'), ('active', '<i8'), ('slots', slot, (2,))])
+
+
+class Checkpoint(object):
+    '''
+        a memory-mapped checkpoint file
+        Checkpoint(path, n) creates the file for n bodies, Checkpoint(path) opens it
+    '''
+
+    def __init__(self, path, n=None):
+        self.path = path
+        if n is None:
+            header = np.memmap(path, dtype=_HEADER, mode='r', shape=(1,))[0]
+            if header['magic'] != MAGIC:
+                raise ValueError('%s is not an nbody checkpoint' % path)
+            n = int(header['n'])
+            self.mm = np.memmap(path, dtype=_dtype(n), mode='r+', shape=(1,))
+        else:
+            self.mm = np.memmap(path, dtype=_dtype(n), mode='w+', shape=(1,))
+            self.mm['magic'] = MAGIC
+            self.mm['n'] = n
+            self.mm['active'] = -1
+            self.mm.flush()
+        self.n = n
+
+    def save(self, bodies, step, loop, dt, integrator):
+        '''
+            write the state into the inactive slot and make it the active one
+        '''
+        (r, v, m) = bodies
+        record = self.mm[0]
+        target = 1 if record['active'] == 0 else 0
+        slot = record['slots'][target]
+
+        slot['step'] = step
+        slot['loop'] = loop
+        slot['dt'] = dt
+        slot['integrator'] = integrator.encode()
+        slot['r'][...] = r
+        slot['v'][...] = v
+        slot['m'][...] = m
+        self.mm.flush()
+
+        record['active'] = target
+        self.mm.flush()
+
+    def load(self):
+        '''
+            copy of the active slot
+            returns ((r, v, m), step, loop, dt, integrator)
+        '''
+        record = self.mm[0]
+        if record['active'] < 0:
+            raise ValueError('%s holds no checkpoint yet' % self.path)
+        slot = record['slots'][record['active']]
+        bodies = (np.array(slot['r']), np.array(slot['v']), np.array(slot['m']))
+        return (bodies, int(slot['step']), int(slot['loop']), float(slot['dt']),
+                slot['integrator'].decode())
+
+    def close(self):
+        self.mm.flush()
+        del self.mm
@@ -0,0 +1,67 @@
+"""
+    N-body simulation.
+
+    entry point for the Cython engine in nbody_cython.pyx
+
+    the compiled extension is used when it has been built with
+        python setup_cython.py build_ext --inplace
+    otherwise the same functions (same (r, v, m) float64 signatures) run on nbody_numpy,
+    COMPILED tells which one was picked
+"""
+
+try:
+    from nbody_cython import (advance, advance_parallel, report_energy,
+                              offset_momentum, nbody, PARALLEL_THRESHOLD)
+    COMPILED = True
+
+except ImportError:
+    import nbody_numpy
+    from nbody_opt import BODIES
+
+    COMPILED = False
+    PARALLEL_THRESHOLD = 256
+
+    def advance(r, v, m, iterations, dt):
+        '''
+            advance the system iterations timesteps
+        '''
+        pairs = nbody_numpy.make_pairs(len(m))
+        for _ in range(iterations):
+            nbody_numpy.advance((r, v, m), pairs, dt)
+
+    advance_parallel = advance
+
+    def report_energy(r, v, m, e=0.0):
+        '''
+            compute the energy and return it so that it can be printed
+        '''
+        return nbody_numpy.report_energy((r, v, m), nbody_numpy.make_pairs(len(m)), e)
+
+    def offset_momentum(v, m, ref):
+        '''
+            ref is the index of the body in the center of the system
+            offset values from this reference
+        '''
+        nbody_numpy.offset_momentum((None, v, m), ref)
+
+    def nbody(loops, reference, iterations, bodies=None):
+        '''
+            nbody simulation
+            loops - number of loops to run
+            reference - body at center of system (str, or bytes as before)
+            iterations - number of timesteps to advance
+            bodies - optional BODIES style dict, BODIES by default
+        '''
+        if isinstance(reference, bytes):
+            reference = reference.decode()
+        names, (r, v, m) = nbody_numpy.arrays_from_bodies(BODIES if bodies is None else bodies)
+
+        # Set up global state
+        offset_momentum(v, m, names.index(reference))
+
+        for _ in range(loops):
+            advance(r, v, m, iterations, 0.01)
+            print(report_energy(r, v, m))
+
+if __name__ == '__main__':
+    nbody(100, 'sun', 20000)
@@ -0,0 +1,161 @@
+"""
+    N-body simulation.
+
+    selectable symplectic integrators for the array engines
+
+    every scheme is a fixed sequence of drifts (r += c * dt * v) and kicks
+    (v += d * dt * a(r)) per step:
+    1. euler: kick then drift, first order, the scheme of every advance() in this repo
+    2. leapfrog: velocity Verlet (kick-drift-kick), second order
+    3. yoshida4: Yoshida's 4th order triple jump of velocity Verlet (kick first)
+    4. forest-ruth: the Forest-Ruth 4th order scheme in its position form (drift first)
+
+    a kick reuses the accelerations of the previous kick when no drift happened in
+    between, so leapfrog costs one force evaluation per step and the 4th order schemes three
+
+    energy diagnostics are fused with a force evaluation (energy_every), reusing its pair
+    distances instead of a second pair sweep through report_energy; 1000 bodies,
+    10 steps with the energy every step:
+    euler: no energy 0.553s, fused 0.569s, report_energy 0.922s
+    leapfrog: no energy 0.602s, fused 0.660s, report_energy 0.892s
+
+    the schemes only use r, v and an accel(bodies, pairs, potential=False) function with
+    the contract of nbody_numpy.accelerations, so they work for every engine that has one:
+    nbody_numpy, nbody_tiled, nbody_mixed, nbody_cells (and its NeighbourList);
+    nbody_barneshut, nbody_pm and nbody_ensemble have no potential, so they work without
+    energy_every (integrate raises ValueError when it is asked for with them)
+
+    benchmark(): BODIES for 20 years, cheapest run with final energy error <= 1e-6
+    euler: dt=0.00125, 16000 steps, 0.491s
+    leapfrog: dt=0.005, 4000 steps, 0.142s
+    yoshida4: dt=0.04, 500 steps, 0.041s
+    forest-ruth: dt=0.04, 500 steps, 0.034s
+"""
+
+import inspect
+import time
+
+import numpy as np
+
+_THETA = 1. / (2. - 2. ** (1. / 3.))
+
+SCHEMES = {
+    'euler': (('kick', 1.), ('drift', 1.)),
+    'leapfrog': (('kick', .5), ('drift', 1.), ('kick', .5)),
+    'yoshida4': (('kick', _THETA / 2.), ('drift', _THETA),
+                 ('kick', (1. - _THETA) / 2.), ('drift', 1. - 2. * _THETA),
+                 ('kick', (1. - _THETA) / 2.), ('drift', _THETA),
+                 ('kick', _THETA / 2.)),
+    'forest-ruth': (('drift', _THETA / 2.), ('kick', _THETA),
+                    ('drift', (1. - _THETA) / 2.), ('kick', 1. - 2. * _THETA),
+                    ('drift', (1. - _THETA) / 2.), ('kick', _THETA),
+                    ('drift', _THETA / 2.)),
+}
+
+
+def kinetic_energy(bodies):
+    '''
+        kinetic energy, summed over the bodies (the last axis of m)
+    '''
+    (r, v, m) = bodies
+    return np.sum(m * np.einsum('...k,...k->...', v, v), axis=-1) / 2.
+
+
+def _takes_potential(accel):
+    try:
+        parameters = inspect.signature(accel).parameters.values()
+    except (TypeError, ValueError):
+        # no signature to check (a builtin), let the call decide
+        return True
+    return any(p.name == 'potential' or p.kind == p.VAR_KEYWORD for p in parameters)
+
+
+def integrate(bodies, pairs, dt, steps, integrator, accel, callback=None, energy_every=0):
+    '''
+        advance the system steps timesteps of size dt with the named scheme
+        accel(bodies, pairs) returns the accelerations, shaped like r
+        callback(step, e), if given, is called after every step with the number of
+        steps done and, every energy_every steps, the total energy (None otherwise)
+
+        the energy is fused with the force evaluation at the same positions:
+        accel(bodies, pairs, potential=True) must return (a, potential) then.
+        schemes that end with a kick get it for free; for schemes that end with a
+        drift the evaluation is moved to the end of the step and reused by the next
+        kick when no drift comes first (euler)
+    '''
+    if energy_every and not _takes_potential(accel):
+        raise ValueError('energy_every needs an accel(bodies, pairs, potential=False) that '
+                         'can return the potential, %r cannot' % (accel,))
+    (r, v, m) = bodies
+    scheme = SCHEMES[integrator]
+    tail = len(scheme) - 1 if scheme[-1][0] == 'kick' else None
+
+    a = None
+    for step in range(steps):
+        due = energy_every and (step + 1) % energy_every == 0
+        for (k, (op, c)) in enumerate(scheme):
+            if op == 'kick':
+                ########### update_vs ###########
+                if a is None:
+                    if due and k == tail:
+                        (a, potential) = accel(bodies, pairs, potential=True)
+                    else:
+                        a = accel(bodies, pairs)
+                v += (c * dt) * a
+                ############# end ###############
+            else:
+                ########### update_rs #############
+                r += (c * dt) * v
+                a = None
+                ############## end ################
+
+        e = None
+        if due:
+            ########### compute_energy ############
+            if tail is None:
+                (a, potential) = accel(bodies, pairs, potential=True)
+            e = potential + kinetic_energy(bodies)
+            ################ end ##################
+
+        if callback is not None:
+            callback(step + 1, e)
+
+
+def benchmark(target=1e-6, years=20., dts=(0.04, 0.02, 0.01, 0.005, 0.0025, 0.00125)):
+    '''
+        for every integrator run the BODIES system for the given number of years at each dt
+        and report the relative error of the final report_energy and the wall time,
+        then the cheapest run of each integrator that reaches the target error
+    '''
+    import nbody_numpy
+    from nbody_opt import BODIES
+
+    names, initial = nbody_numpy.arrays_from_bodies(BODIES)
+    nbody_numpy.offset_momentum(initial, names.index('sun'))
+    pairs = nbody_numpy.make_pairs(len(names))
+    e0 = nbody_numpy.report_energy(initial, pairs)
+
+    print('%12s %9s %8s %12s %10s' % ('integrator', 'dt', 'steps', 'rel. error', 'time (s)'))
+    best = {}
+    for integrator in SCHEMES:
+        for dt in dts:
+            bodies = tuple(x.copy() for x in initial)
+            steps = int(round(years / dt))
+            t0 = time.perf_counter()
+            integrate(bodies, pairs, dt, steps, integrator, nbody_numpy.accelerations)
+            elapsed = time.perf_counter() - t0
+            err = abs(nbody_numpy.report_energy(bodies, pairs) / e0 - 1.)
+            print('%12s %9g %8d %12.3e %10.3f' % (integrator, dt, steps, err, elapsed))
+            if err <= target and (integrator not in best or elapsed < best[integrator][1]):
+                best[integrator] = (dt, elapsed)
+
+    print('cheapest run with final energy error <= %g over %g years:' % (target, years))
+    for integrator in SCHEMES:
+        if integrator in best:
+            print('%12s dt=%g %.3fs' % (integrator, best[integrator][0], best[integrator][1]))
+        else:
+            print('%12s not reached, dt=%g or smaller needed' % (integrator, dts[-1] / 2.))
+    return best
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,229 @@
+"""
+    N-body simulation.
+
+    mixed precision for the array engine
+
+    the first nbody_cython declared everything as C float by accident; this is the
+    deliberate version of that trade:
+    1. accelerations: the pair differences, distances and magnitudes are float32
+       (half the memory traffic of the (npairs,3) temporaries and twice the SIMD width),
+       the per body sums are float64 (np.bincount accumulates in float64) and the
+       state r, v stays float64
+    2. CompensatedState: r and v themselves stored as float32 with a float32 Kahan
+       compensation term per component (classic Kahan, 8 bytes per component), so the
+       many small dt * v and dt * a updates are not lost against the float32 rounding of
+       the values they are added to; views and indexed updates (v[active] += ...) carry
+       their part of the compensation
+    3. report_energy: float32 pair terms summed in float64
+
+    `python -m nbody --backend mixed` runs it
+
+    validate(): BODIES for 20 years at dt=0.01, relative energy drift measured with the
+    float64 report_energy, and the largest difference from the float64 run's drift
+    euler:    float64 -2.104e-05, mixed -2.105e-05 (1.1e-08), float32+kahan -2.105e-05 (1.5e-08),
+              float32 -1.961e-05 (2.3e-06)
+    leapfrog: float64 -1.051e-06, mixed -1.053e-06 (3.8e-09), float32+kahan -1.071e-06 (2.1e-08),
+              float32 -4.066e-06 (3.2e-06)
+    report_energy mixed vs float64: 2.0e-07 relative
+
+    throughput(): accelerations, mixed vs float64
+    N=256 1.35x, N=1024 1.44x, N=2048 1.19x, max relative error 3e-06;
+    the float64 bincount accumulation keeps the gain well below 2x
+"""
+
+import time
+
+import numpy as np
+
+import nbody_numpy
+
+
+def accelerations(bodies, pairs, potential=False):
+    '''
+        nbody_numpy.accelerations with the pair terms in float32
+        returns float64 accelerations (and a float64 potential)
+    '''
+    (r, v, m) = bodies
+    (i, j) = pairs
+    n = len(m)
+    # plain ndarrays: indexing a CompensatedState's _Compensated r would carry c along
+    r32 = np.asarray(r.view(np.ndarray), dtype=np.float32)
+    m32 = np.asarray(m.view(np.ndarray), dtype=np.float32)
+
+    d = r32[i] - r32[j]
+    d2 = np.einsum('ij,ij->i', d, d)
+    mag = d2 ** np.float32(-1.5)
+    mi = m32[i] * mag
+    mj = m32[j] * mag
+
+    a = np.empty(r.shape, dtype=np.float64)
+    for k in range(3):
+        a[:, k] = (np.bincount(j, weights=d[:, k] * mi, minlength=n)
+                   - np.bincount(i, weights=d[:, k] * mj, minlength=n))
+
+    if potential:
+        return a, -np.sum(m32[i] * mj * d2, dtype=np.float64)
+    return a
+
+
+def report_energy(bodies, pairs, e=0.0):
+    '''
+        energy with float32 pair terms and float64 sums
+    '''
+    (r, v, m) = bodies
+    (i, j) = pairs
+    r32 = np.asarray(r, dtype=np.float32)
+    m32 = np.asarray(m, dtype=np.float32)
+
+    d = r32[i] - r32[j]
+    e -= np.sum(m32[i] * m32[j] / np.sqrt(np.einsum('ij,ij->i', d, d)), dtype=np.float64)
+    e += float(np.sum(m * np.einsum('ij,ij->i', v, v), dtype=np.float64)) / 2.
+    return float(e)
+
+
+class _Compensated(np.ndarray):
+    # float32 array whose in-place additions are Kahan compensated, with the float32
+    # compensation c; integrate() only ever does `x += increment` on r and v
+    def __array_finalize__(self, obj):
+        # views are given their slice of c by __getitem__, other new arrays start exact
+        self.c = np.zeros(self.shape, dtype=np.float32)
+
+    def __getitem__(self, index):
+        item = super(_Compensated, self).__getitem__(index)
+        if isinstance(item, _Compensated):
+            # a view of c for basic indexing, a copy for fancy indexing
+            item.c = self.c[index]
+        return item
+
+    def __setitem__(self, index, value):
+        # x[k] += y is x.__setitem__(k, x[k].__iadd__(y)): keep the compensation of
+        # the updated copy, plain assignments are exact
+        super(_Compensated, self).__setitem__(index, value)
+        self.c[index] = value.c if isinstance(value, _Compensated) else 0.
+
+    def __iadd__(self, increment):
+        x = self.view(np.ndarray)
+        y = (np.asarray(increment, dtype=np.float64) - self.c).astype(np.float32)
+        t = x + y
+        self.c[...] = (t - x) - y
+        x[...] = t
+        return self
+
+
+class CompensatedState(object):
+    '''
+        r, v stored as float32 with a float32 compensation each (Kahan summation), the
+        same 8 bytes per component as float64 but the force pass reads only the 4 byte
+        values; iterates as (r, v, m) like the other engines' state
+    '''
+
+    def __init__(self, bodies):
+        (r, v, m) = bodies
+        self.r = self._wrap(r)
+        self.v = self._wrap(v)
+        self.m = np.asarray(m, dtype=np.float64)
+
+    @staticmethod
+    def _wrap(x):
+        x = np.asarray(x, dtype=np.float64)
+        stored = np.ascontiguousarray(x, dtype=np.float32).view(_Compensated)
+        # the rounding of the initial value is the first error to compensate
+        stored.c = (stored.view(np.ndarray) - x).astype(np.float32)
+        return stored
+
+    def __iter__(self):
+        return iter((self.r, self.v, self.m))
+
+    def __len__(self):
+        return len(self.m)
+
+    def to_float64(self):
+        '''
+            (r, v, m) float64 arrays with the compensation applied
+        '''
+        return tuple(x.view(np.ndarray).astype(np.float64) - x.c for x in (self.r, self.v)) + \
+            (self.m,)
+
+
+def validate(years=20., dt=0.01, reference='sun', sample=20):
+    '''
+        run the BODIES system with euler and leapfrog for the given number of years in
+        1. float64 (nbody_numpy, the reference)
+        2. mixed: float32 pair terms, float64 state and sums
+        3. float32 state with Kahan compensated updates and float32 pair terms
+        4. float32 state, plain float32 updates
+        and print the relative report_energy drift of each at `sample` points, the
+        largest difference from the float64 energies and the wall time
+    '''
+    from nbody_integrators import integrate
+    from nbody_opt import BODIES
+
+    names, initial = nbody_numpy.arrays_from_bodies(BODIES)
+    nbody_numpy.offset_momentum(initial, names.index(reference))
+    pairs = nbody_numpy.make_pairs(len(names))
+    e0 = nbody_numpy.report_energy(initial, pairs)
+    steps = int(round(years / dt))
+    every = max(steps // sample, 1)
+
+    def run(integrator, accel, bodies, energy):
+        drift = []
+        start = time.perf_counter()
+        integrate(bodies, pairs, dt, steps, integrator, accel,
+                  lambda step, e: step % every or drift.append(energy(bodies) / e0 - 1.))
+        return np.array(drift), time.perf_counter() - start
+
+    def exact(b):
+        return nbody_numpy.report_energy(tuple(np.asarray(x, dtype=np.float64) for x in b), pairs)
+
+    # every mode's state is measured with the float64 report_energy, so the drift is
+    # the integration error alone
+    modes = (
+        ('float64', nbody_numpy.accelerations, lambda: tuple(x.copy() for x in initial), exact),
+        ('mixed', accelerations, lambda: tuple(x.copy() for x in initial), exact),
+        ('float32+kahan', accelerations, lambda: CompensatedState(initial),
+         lambda b: exact(b.to_float64())),
+        ('float32', accelerations, lambda: tuple(x.astype(np.float32) for x in initial), exact),
+    )
+
+    report = {}
+    print('%10s %14s %12s %12s %12s %9s' % (
+        'integrator', 'mode', 'final drift', 'max |drift|', 'vs float64', 'time (s)'))
+    for integrator in ('euler', 'leapfrog'):
+        reference_drift = None
+        for (mode, accel, state, energy) in modes:
+            (drift, elapsed) = run(integrator, accel, state(), energy)
+            if reference_drift is None:
+                reference_drift = drift
+            report[(integrator, mode)] = drift
+            print('%10s %14s %12.3e %12.3e %12.3e %9.3f' % (
+                integrator, mode, drift[-1], np.abs(drift).max(),
+                np.abs(drift - reference_drift).max(), elapsed))
+    print('report_energy mixed vs float64 on the initial state: %.3e' % (
+        report_energy(initial, pairs) / e0 - 1.))
+    return report
+
+
+def throughput(sizes=(256, 1024, 2048), repeat=5, seed=0):
+    '''
+        time accelerations in float64 and mixed precision for random systems of the
+        given sizes and print the largest relative difference of the results
+    '''
+    print('%6s %12s %12s %8s %12s' % ('N', 'float64 (s)', 'mixed (s)', 'speedup', 'max rel err'))
+    for n in sizes:
+        rng = np.random.default_rng(seed)
+        bodies = (rng.uniform(-1., 1., (n, 3)), np.zeros((n, 3)), np.full(n, 1. / n))
+        pairs = nbody_numpy.make_pairs(n)
+        times = []
+        for accel in (nbody_numpy.accelerations, accelerations):
+            accel(bodies, pairs)
+            start = time.perf_counter()
+            for _ in range(repeat):
+                accel(bodies, pairs)
+            times.append((time.perf_counter() - start) / repeat)
+        a = nbody_numpy.accelerations(bodies, pairs)
+        err = np.abs(accelerations(bodies, pairs) - a).max() / np.abs(a).max()
+        print('%6d %12.4f %12.4f %8.2f %12.3e' % (n, times[0], times[1], times[0] / times[1], err))
+
+if __name__ == '__main__':
+    validate()
+    throughput()
@@ -0,0 +1,222 @@
+"""
+    N-body simulation.
+
+    structure-of-arrays engine
+
+    1. positions, velocities and masses are kept in contiguous (N,3)/(N,) float64 arrays
+    2. pairs are precomputed once as i<j index arrays (numpy.triu_indices)
+    3. advance and report_energy are vectorized pairwise kernels over those index arrays,
+       so there is no interpreter overhead per pair
+"""
+
+import sys
+from functools import partial
+
+import numpy as np
+
+import nbody_cells
+from nbody_cells import NeighbourList
+from nbody_cache import ResultCache
+from nbody_checkpoint import Checkpoint
+from nbody_integrators import integrate
+from nbody_opt import BODIES
+from nbody_profile import Profile
+from nbody_trajectory import TrajectoryWriter
+
+
+def arrays_from_bodies(bodies):
+    '''
+        convert a BODIES style dict into (names, (r, v, m))
+        r and v are (N,3) float64 arrays, m is an (N,) float64 array
+    '''
+    names = list(bodies.keys())
+    r = np.array([bodies[name][0] for name in names], dtype=np.float64)
+    v = np.array([bodies[name][1] for name in names], dtype=np.float64)
+    m = np.array([bodies[name][2] for name in names], dtype=np.float64)
+    return names, (r, v, m)
+
+
+def make_pairs(n):
+    '''
+        precompute the i<j index arrays of all pairs of n bodies
+    '''
+    return np.triu_indices(n, k=1)
+
+
+def accelerations(bodies, pairs, potential=False):
+    '''
+        compute the acceleration of every body from all pairs
+        with potential, also return the potential energy from the same pair distances
+    '''
+    (r, v, m) = bodies
+    (i, j) = pairs
+    n = len(m)
+
+    d = r[i] - r[j]
+    d2 = np.einsum('ij,ij->i', d, d)
+    mag = d2 ** (-1.5)
+    mi = m[i] * mag
+    mj = m[j] * mag
+
+    a = np.empty_like(r)
+    for k in range(3):
+        a[:, k] = (np.bincount(j, weights=d[:, k] * mi, minlength=n)
+                   - np.bincount(i, weights=d[:, k] * mj, minlength=n))
+
+    if potential:
+        # 1/r = r^2 * r^-3, no extra square root
+        return a, -np.sum(m[i] * mj * d2)
+    return a
+
+
+def advance(bodies, pairs, dt):
+    '''
+        advance the system one timestep
+    '''
+    (r, v, m) = bodies
+
+    ########### update_vs ###########
+    v += dt * accelerations(bodies, pairs)
+    ############# end ###############
+
+    ########### update_rs #############
+    r += dt * v
+    ############## end ################
+
+
+def report_energy(bodies, pairs, e=0.0):
+    '''
+        compute the energy and return it so that it can be printed
+    '''
+    (r, v, m) = bodies
+    (i, j) = pairs
+
+    d = r[i] - r[j]
+    ########### compute_energy ############
+    e -= np.sum(m[i] * m[j] / np.sqrt(np.einsum('ij,ij->i', d, d)))
+    ################ end ##################
+
+    e += np.sum(m * np.einsum('ij,ij->i', v, v)) / 2.
+    return float(e)
+
+
+def offset_momentum(bodies, ref):
+    '''
+        ref is the index of the body in the center of the system
+        offset values from this reference
+    '''
+    (r, v, m) = bodies
+    p = -np.sum(v * m[:, None], axis=0)
+    v[ref] = p / m[ref]
+
+
+def nbody(loops, reference, iterations, dt=0.01, integrator='euler',
+          checkpoint=None, resume=None, trajectory=None, every=1, profile=None,
+          eps=0.0, cutoff=None, observers=None, cache=None):
+    '''
+        nbody simulation
+        loops - number of loops to run
+        reference - body at center of system
+        iterations - number of timesteps to advance
+        dt - size of a timestep
+        integrator - one of nbody_integrators.SCHEMES
+        checkpoint - file to checkpoint to at the end of every loop
+        resume - checkpoint file to continue from (dt and integrator are taken from it);
+                 the run keeps checkpointing to it unless checkpoint is given; it must
+                 have been written with the same iterations
+        trajectory - .npy file to stream position snapshots to (see nbody_trajectory);
+                     a resumed run appends to it
+        every - snapshot cadence in steps
+        profile - time the phases of the run (see nbody_profile): True prints a summary
+                  table to stderr at the end, a file name writes it there as JSON
+        eps - softening length
+        cutoff - no interaction beyond this distance, pairs come from a neighbour list
+                 (see nbody_cells)
+        observers - nbody_observers.Observers to hand snapshots to every observers.every
+                    steps; it is closed (its pending observations waited for) at the end
+        cache - nbody_cache.ResultCache or directory: take the energies from a cached run,
+                or extend the longest cached prefix of it (not with the options above)
+    '''
+    names, bodies = arrays_from_bodies(BODIES)
+    pairs = make_pairs(len(names))
+    first = 0
+    ckpt = None
+
+    if resume is not None:
+        ckpt = Checkpoint(resume)
+        (bodies, step, first, dt, integrator) = ckpt.load()
+        if step != first * iterations:
+            ckpt.close()
+            raise ValueError('%s: checkpoint of step %d after loop %d was not written with '
+                             '%d iterations per loop' % (resume, step, first, iterations))
+        if checkpoint is not None and checkpoint != resume:
+            ckpt.close()
+            ckpt = Checkpoint(checkpoint, len(names))
+    else:
+        # Set up global state
+        offset_momentum(bodies, names.index(reference))
+        if checkpoint is not None:
+            ckpt = Checkpoint(checkpoint, len(names))
+
+    writer = None
+    if trajectory is not None:
+        writer = TrajectoryWriter(trajectory, len(names), every,
+                                  resume=first * iterations if resume is not None else None)
+        writer.snapshot(bodies[0], first * iterations, first * iterations * dt)
+
+    base = first * iterations
+
+    def callback(step, e):
+        if writer is not None:
+            writer.snapshot(bodies[0], base + step, (base + step) * dt)
+        if observers is not None and (base + step) % observers.every == 0:
+            observers.observe(base + step, (base + step) * dt, bodies)
+        if e is not None:
+            if ckpt is not None:
+                # the trajectory up to the checkpoint has to be on disk before it is
+                if writer is not None:
+                    writer.flush()
+                ckpt.save(bodies, base + step, (base + step) // iterations, dt, integrator)
+            print(float(e))
+
+    accel = accelerations
+    if cutoff is not None:
+        accel = NeighbourList(cutoff, eps)
+    elif eps:
+        accel = partial(nbody_cells.accelerations, eps=eps)
+
+    steps = (loops - first) * iterations
+    if cache is not None:
+        if any(x is not None for x in (checkpoint, resume, trajectory, observers)) or profile:
+            raise ValueError('cache cannot be combined with checkpoint, resume, trajectory, '
+                             'observers or profile')
+        if not isinstance(cache, ResultCache):
+            cache = ResultCache(cache)
+        (_, energies) = cache.run(bodies, pairs, dt, steps, integrator, accel, iterations,
+                                  (eps, cutoff))
+        for e in energies:
+            print(e)
+        return
+
+    if profile:
+        prof = Profile()
+        with prof:
+            integrate(bodies, pairs, dt, steps, integrator, prof.accel(accel),
+                      prof.callback(callback), energy_every=iterations)
+        if profile is True:
+            sys.stderr.write(prof.table() + '\n')
+        else:
+            prof.dump(profile)
+    else:
+        integrate(bodies, pairs, dt, steps, integrator, accel,
+                  callback, energy_every=iterations)
+
+    if ckpt is not None:
+        ckpt.close()
+    if writer is not None:
+        writer.close()
+    if observers is not None:
+        observers.close()
+
+if __name__ == '__main__':
+    nbody(100, 'sun', 20000)
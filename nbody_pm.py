@@ -0,0 +1,154 @@
+"""
+    N-body simulation.
+
+    particle-mesh (PM) gravity for smooth, large-N distributions
+
+    1. mass is deposited onto a G^3 grid with cloud-in-cell (CIC) weights
+    2. the potential is solved with numpy FFTs, either periodically (box=L, cosmology style)
+       or for an isolated system on a zero-padded 2G grid with a 1/r Green's function
+    3. the grid force is a central difference of the potential and is interpolated back
+       to the bodies with the same CIC weights, so the scheme conserves momentum
+    4. the cost per step is O(N + G^3 log G) and advance keeps the
+       advance(bodies, pairs, dt) contract of nbody_numpy; pairs is unused
+
+    forces are smoothed on the scale of a grid cell, so close encounters are not resolved
+"""
+
+import numpy as np
+
+# average of 1/r over a cube of unit side, used for the self cell of the Green's function
+SELF_POTENTIAL = 2.380077
+
+_greens = {}
+
+
+def _cic(x, g):
+    '''
+        CIC cell indices and weights for positions x given in units of the grid spacing
+        returns lists of the 8 corner cells (N,3) and their weights (N,)
+    '''
+    x = x - 0.5
+    i0 = np.floor(x).astype(np.intp)
+    f = x - i0
+
+    idx = []
+    wts = []
+    for corner in range(8):
+        o = (corner >> np.arange(3)) & 1
+        cell = (i0 + o) % g
+        w = np.prod(np.where(o, f, 1. - f), axis=1)
+        idx.append(cell)
+        wts.append(w)
+    return idx, wts
+
+
+def _flat(cell, shape):
+    return (cell[:, 0] * shape[1] + cell[:, 1]) * shape[2] + cell[:, 2]
+
+
+def _gradient(phi, h):
+    '''
+        central difference of the potential along each axis
+    '''
+    return [(np.roll(phi, -1, axis=k) - np.roll(phi, 1, axis=k)) / (2. * h) for k in range(3)]
+
+
+def _green(g):
+    '''
+        FFT of the isolated 1/r Green's function on a 2g grid with unit spacing
+    '''
+    if g not in _greens:
+        k = np.arange(2 * g)
+        k = np.minimum(k, 2 * g - k).astype(np.float64)
+        dist = np.sqrt(k[:, None, None] ** 2 + k[None, :, None] ** 2 + k[None, None, :] ** 2)
+        dist[0, 0, 0] = 1. / SELF_POTENTIAL
+        _greens[g] = np.fft.rfftn(-1. / dist)
+    return _greens[g]
+
+
+def potential_periodic(rho, box):
+    '''
+        solve nabla^2 phi = 4 pi rho in a periodic box with FFTs
+    '''
+    g = rho.shape[0]
+    k = 2. * np.pi * np.fft.fftfreq(g, d=box / g)
+    kz = 2. * np.pi * np.fft.rfftfreq(g, d=box / g)
+    k2 = k[:, None, None] ** 2 + k[None, :, None] ** 2 + kz[None, None, :] ** 2
+    k2[0, 0, 0] = 1.
+
+    rho_k = np.fft.rfftn(rho)
+    phi_k = -4. * np.pi * rho_k / k2
+    phi_k[0, 0, 0] = 0.
+    return np.fft.irfftn(phi_k, s=rho.shape, axes=(0, 1, 2))
+
+
+def potential_isolated(mass, h):
+    '''
+        potential of the grid masses for an isolated system by convolution with
+        -1/r on a zero-padded grid twice the size
+    '''
+    g = mass.shape[0]
+    padded = np.zeros((2 * g,) * 3)
+    padded[:g, :g, :g] = mass
+    return np.fft.irfftn(np.fft.rfftn(padded) * _green(g), s=padded.shape, axes=(0, 1, 2)) / h
+
+
+def accelerations(bodies, pairs=None, grid=64, box=None):
+    '''
+        compute the acceleration of every body on a grid^3 mesh
+        box - side of the periodic box [0, box)^3, or None for an isolated system
+    '''
+    (r, v, m) = bodies
+
+    if box is None:
+        ########### isolated: fit the bodies into the grid ###########
+        lo = r.min(axis=0)
+        extent = max(float(np.max(r.max(axis=0) - lo)), 1e-12)
+        h = extent / (grid - 2)
+        origin = lo - h
+        ########################### end ##############################
+    else:
+        h = box / grid
+        origin = np.zeros(3)
+
+    idx, wts = _cic((r - origin) / h, grid)
+    shape = (grid,) * 3
+
+    ########### deposit ###########
+    mass = np.zeros(grid ** 3)
+    for cell, w in zip(idx, wts):
+        mass += np.bincount(_flat(cell, shape), weights=m * w, minlength=grid ** 3)
+    mass = mass.reshape(shape)
+    ############# end #############
+
+    if box is None:
+        phi = potential_isolated(mass, h)
+    else:
+        phi = potential_periodic(mass / h ** 3, box)
+
+    ########### interpolate the grid force back ###########
+    force = _gradient(phi, h)
+    a = np.zeros_like(r)
+    for cell, w in zip(idx, wts):
+        flat = _flat(cell, phi.shape)
+        for k in range(3):
+            a[:, k] -= w * force[k].ravel()[flat]
+    ######################### end #########################
+    return a
+
+
+def advance(bodies, pairs, dt, grid=64, box=None):
+    '''
+        advance the system one timestep
+    '''
+    (r, v, m) = bodies
+
+    ########### update_vs ###########
+    v += dt * accelerations(bodies, pairs, grid, box)
+    ############# end ###############
+
+    ########### update_rs #############
+    r += dt * v
+    if box is not None:
+        r %= box
+    ############## end ################
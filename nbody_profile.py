@@ -0,0 +1,136 @@
+"""
+    N-body simulation.
+
+    opt-in phase instrumentation for integrate()
+
+    the integrator loop itself is not touched: a Profile wraps the functions it calls,
+    so an unprofiled run executes exactly the same code as before
+    1. force: accel(bodies, pairs) calls, with the pair interactions accel evaluated
+       counted: the pairs passed in, the current list of an accel with its own (a
+       nbody_cells.NeighbourList, its npairs), or all N(N-1)/2 pairs when pairs is None
+       (nbody_tiled)
+    2. energy: accel(bodies, pairs, potential=True) calls, the force evaluations the
+       energy diagnostics are fused with; compare its time per call with force's
+       for the cost of the diagnostics
+    3. output: the per step callback (trajectory snapshots, checkpoints, printing)
+    4. update: the rest of the wall time, i.e. the kicks, the drifts (update_rs) and
+       the loop itself (and the kinetic energy)
+
+        profile = Profile()
+        with profile:
+            integrate(bodies, pairs, dt, steps, integrator,
+                      profile.accel(accelerations), profile.callback(callback), every)
+        print(profile.table())
+"""
+
+import json
+import time
+from functools import wraps
+
+PHASES = ('force', 'energy', 'update', 'output')
+
+
+class Profile(object):
+    '''
+        perf_counter_ns timers and call counts per phase, plus pair interaction
+        and step counters
+    '''
+
+    def __init__(self):
+        self.ns = dict.fromkeys(PHASES, 0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        self.pairs = 0
+        self.steps = 0
+        self.total_ns = 0
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.total_ns += time.perf_counter_ns() - self._start
+        self._start = None
+
+    def accel(self, accel):
+        '''
+            accel timed as force, or as energy when the potential is asked for
+        '''
+        ns = self.ns
+        calls = self.calls
+
+        @wraps(accel)
+        def timed(bodies, pairs, potential=False):
+            start = time.perf_counter_ns()
+            if potential:
+                result = accel(bodies, pairs, potential=True)
+                phase = 'energy'
+            else:
+                result = accel(bodies, pairs)
+                phase = 'force'
+            ns[phase] += time.perf_counter_ns() - start
+            calls[phase] += 1
+            if hasattr(accel, 'npairs'):
+                self.pairs += accel.npairs
+            elif pairs is None:
+                n = len(bodies[2])
+                self.pairs += n * (n - 1) // 2
+            else:
+                self.pairs += len(pairs[0])
+            return result
+        return timed
+
+    def callback(self, callback):
+        '''
+            callback(step, e) timed as output; counts the steps
+        '''
+        ns = self.ns
+        calls = self.calls
+
+        @wraps(callback)
+        def timed(step, e):
+            self.steps += 1
+            if callback is None:
+                return
+            start = time.perf_counter_ns()
+            callback(step, e)
+            ns['output'] += time.perf_counter_ns() - start
+            calls['output'] += 1
+        return timed
+
+    def summary(self):
+        '''
+            dict of the per phase times (s), calls and shares of the wall time,
+            the counters and the rates
+        '''
+        total = self.total_ns
+        ns = dict(self.ns)
+        ns['update'] = max(total - ns['force'] - ns['energy'] - ns['output'], 0)
+        seconds = total * 1e-9
+        return {
+            'phases': {phase: {'seconds': ns[phase] * 1e-9,
+                               'calls': self.calls[phase] if phase != 'update' else self.steps,
+                               'share': ns[phase] / total if total else 0.}
+                       for phase in PHASES},
+            'seconds': seconds,
+            'steps': self.steps,
+            'pair_interactions': self.pairs,
+            'steps_per_second': self.steps / seconds if seconds else 0.,
+            'pairs_per_second': self.pairs / seconds if seconds else 0.,
+        }
+
+    def table(self):
+        summary = self.summary()
+        lines = ['%-8s %10s %10s %8s %12s' % ('phase', 'time (s)', 'calls', 'share', 'us/call')]
+        for (phase, row) in summary['phases'].items():
+            lines.append('%-8s %10.4f %10d %7.1f%% %12.2f' % (
+                phase, row['seconds'], row['calls'], 100 * row['share'],
+                1e6 * row['seconds'] / row['calls'] if row['calls'] else 0.))
+        lines.append('%-8s %10.4f %10d steps, %.0f steps/s, %d pair interactions, %.3g pairs/s' % (
+            'total', summary['seconds'], summary['steps'], summary['steps_per_second'],
+            summary['pair_interactions'], summary['pairs_per_second']))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.summary(), f, indent=2)
@@ -0,0 +1,227 @@
+"""
+    N-body simulation.
+
+    shared-memory multiprocessing backend for a single node
+
+    1. positions (double buffered), velocities, masses and a small control block live in
+       one multiprocessing.shared_memory segment that every worker maps as numpy arrays
+    2. each worker owns a slice of bodies: it reads all positions from the current buffer,
+       accumulates the forces on its slice, kicks its velocities and drifts its positions
+       into the other buffer
+    3. because positions are double buffered, one barrier per step is enough
+    4. nothing is pickled per step; the parent only writes the control block and
+       waits on a barrier when it wants to look at the state (e.g. report_energy)
+    5. the parent waits on the barrier from a helper thread and checks that the workers
+       are alive meanwhile (a multiprocessing barrier cannot be aborted once one of its
+       waiters is killed), so a dead worker or the timeout raises RuntimeError instead of
+       blocking forever; the segment is unlinked on every error
+"""
+
+import os
+import multiprocessing as mp
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import nbody_numpy
+from nbody_opt import BODIES
+
+# rows of the slice computed at once, bounds the (rows, N, 3) temporaries
+BLOCK = 256
+# seconds between liveness checks of the workers while the parent waits
+POLL = 0.1
+
+RUN = 0
+STOP = 1
+
+
+def _views(buf, n):
+    '''
+        numpy views of the shared segment
+        returns (ctrl, r, v, m) with r shaped (2, n, 3) for the two position buffers
+        ctrl holds [command, steps, dt, parity]
+    '''
+    ctrl = np.ndarray((4,), dtype=np.float64, buffer=buf)
+    r = np.ndarray((2, n, 3), dtype=np.float64, buffer=buf, offset=4 * 8)
+    v = np.ndarray((n, 3), dtype=np.float64, buffer=buf, offset=(4 + 6 * n) * 8)
+    m = np.ndarray((n,), dtype=np.float64, buffer=buf, offset=(4 + 9 * n) * 8)
+    return ctrl, r, v, m
+
+
+def _slice_accelerations(r, m, lo, hi):
+    '''
+        acceleration on bodies lo:hi from all bodies
+    '''
+    a = np.empty((hi - lo, 3))
+    for first in range(lo, hi, BLOCK):
+        last = min(first + BLOCK, hi)
+        d = r[first:last, None, :] - r[None, :, :]
+        d2 = np.einsum('ijk,ijk->ij', d, d)
+        d2[np.arange(last - first), np.arange(first, last)] = np.inf
+        mag = m[None, :] * d2 ** (-1.5)
+        a[first - lo:last - lo] = -np.einsum('ij,ijk->ik', mag, d)
+    return a
+
+
+def _worker(name, n, lo, hi, go, step):
+    '''
+        worker loop: wait for the parent, run the requested steps on bodies lo:hi
+    '''
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        ctrl, r, v, m = _views(shm.buf, n)
+        while True:
+            go.wait()
+            if ctrl[0] == STOP:
+                break
+
+            steps = int(ctrl[1])
+            dt = ctrl[2]
+            parity = int(ctrl[3])
+            for _ in range(steps):
+                cur = r[parity]
+                a = _slice_accelerations(cur, m, lo, hi)
+
+                ########### update_vs ###########
+                v[lo:hi] += dt * a
+                ############# end ###############
+
+                ########### update_rs #############
+                r[1 - parity, lo:hi] = cur[lo:hi] + dt * v[lo:hi]
+                ############## end ################
+
+                parity = 1 - parity
+                step.wait()
+
+            go.wait()
+    finally:
+        del ctrl, r, v, m
+        shm.close()
+
+
+class SharedSystem(object):
+    '''
+        (r, v, m) held in shared memory and advanced by a pool of worker processes
+        timeout - seconds to wait for the workers at a barrier, None for no limit
+    '''
+
+    def __init__(self, bodies, workers=None, timeout=None):
+        (r, v, m) = bodies
+        n = len(m)
+        workers = max(1, min(workers or os.cpu_count() or 1, n))
+
+        self.n = n
+        self.timeout = timeout
+        self.procs = []
+        self.shm = shared_memory.SharedMemory(create=True, size=(4 + 10 * n) * 8)
+        try:
+            self.ctrl, self.r, self.v, self.m = _views(self.shm.buf, n)
+            self.ctrl[:] = (RUN, 0, 0., 0)
+            self.r[0] = r
+            self.v[:] = v
+            self.m[:] = m
+
+            self.go = mp.Barrier(workers + 1)
+            step = mp.Barrier(workers)
+            bounds = np.linspace(0, n, workers + 1).astype(int)
+            for w in range(workers):
+                p = mp.Process(target=_worker,
+                               args=(self.shm.name, n, bounds[w], bounds[w + 1], self.go,
+                                     step),
+                               daemon=True)
+                p.start()
+                self.procs.append(p)
+        except BaseException:
+            self._release()
+            raise
+
+    def _release(self):
+        # stop the workers and free the segment, whatever state they are in
+        for p in self.procs:
+            if p.is_alive():
+                p.terminate()
+            p.join()
+        self.procs = []
+        for name in ('ctrl', 'r', 'v', 'm'):
+            self.__dict__.pop(name, None)
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def _wait(self):
+        # go.wait() without blocking forever on a dead worker
+        done = threading.Event()
+        threading.Thread(target=lambda: (self.go.wait(), done.set()), daemon=True).start()
+        waited = 0.
+        while not done.wait(POLL):
+            waited += POLL
+            dead = [p.exitcode for p in self.procs if not p.is_alive()]
+            if dead or (self.timeout is not None and waited >= self.timeout):
+                self._release()
+                if dead:
+                    raise RuntimeError('worker exited with code %s' % dead[0])
+                raise RuntimeError('workers did not reach the barrier within %gs' % self.timeout)
+
+    @property
+    def bodies(self):
+        '''
+            (r, v, m) views of the current state
+        '''
+        return (self.r[int(self.ctrl[3])], self.v, self.m)
+
+    def advance(self, iterations, dt):
+        '''
+            advance the system iterations timesteps
+        '''
+        if self.shm is None:
+            raise RuntimeError('the system is closed')
+        self.ctrl[1] = iterations
+        self.ctrl[2] = dt
+        self._wait()
+        self._wait()
+        self.ctrl[3] = (int(self.ctrl[3]) + iterations) % 2
+
+    def close(self):
+        if self.shm is None:
+            return
+        if self.procs:
+            self.ctrl[0] = STOP
+            try:
+                self._wait()
+            except RuntimeError:
+                # a worker died on the way out, _wait released everything
+                return
+            for p in self.procs:
+                p.join(self.timeout)
+        self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def nbody(loops, reference, iterations, workers=None):
+    '''
+        nbody simulation
+        loops - number of loops to run
+        reference - body at center of system
+        iterations - number of timesteps to advance
+        workers - number of worker processes, os.cpu_count() by default
+    '''
+    names, bodies = nbody_numpy.arrays_from_bodies(BODIES)
+    pairs = nbody_numpy.make_pairs(len(names))
+
+    # Set up global state
+    nbody_numpy.offset_momentum(bodies, names.index(reference))
+
+    with SharedSystem(bodies, workers) as system:
+        for _ in range(loops):
+            system.advance(iterations, 0.01)
+            print(nbody_numpy.report_energy(system.bodies, pairs))
+
+if __name__ == '__main__':
+    nbody(100, 'sun', 20000)
@@ -0,0 +1,256 @@
+"""
+    N-body simulation.
+
+    pure python engine for PyPy and hosts without numpy
+
+    nbody_opt and nbody_iter look both bodies of a pair up in a dict by name and
+    destructure their ([x, y, z], [vx, vy, vz], m) tuples; here:
+    1. a body is a Body with __slots__ (x, y, z, vx, vy, vz, m): no per instance dict,
+       attribute access is a fixed offset, and PyPy turns the fields into unboxed floats
+    2. the pairs are precomputed once as a tuple of (Body, Body, m1, m2)
+    3. the inner loop only reads and writes slots: no dict lookups, no lists or tuples are
+       built or unpacked per pair, and m * mag is computed once per body of the pair
+       instead of once per component; the only objects left are the float results of
+       the arithmetic, which CPython boxes and PyPy's JIT keeps unboxed
+    4. the whole iterations loop runs in one call, like nbody_iter
+    5. no import outside the standard library
+
+    python nbody_slots.py --benchmark: 20000 steps of BODIES, and the objects created per
+    step counted by tracing the executed opcodes (containers built, float results)
+    CPython 3.11: nbody_opt 0.178s, 0 containers, 310 floats per step
+                  nbody_iter 0.166s, 0 containers, 310 floats per step
+                  nbody_slots 0.115s, 0 containers, 270 floats per step
+    CPython 3.11 already compiles (dx, dy, dz) = (x1-x2, ...) without building a tuple, so
+    the gain there is the dict lookups, unpacking and 4 fewer float temporaries per pair.
+    PyPy was not installed on the host; benchmark() runs the same timing under
+    `pypy3` (or $PYPY) when it is on the PATH
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+from nbody_opt import BODIES
+
+
+class Body(object):
+    __slots__ = ('name', 'x', 'y', 'z', 'vx', 'vy', 'vz', 'm')
+
+    def __init__(self, name, r, v, m):
+        self.name = name
+        (self.x, self.y, self.z) = r
+        (self.vx, self.vy, self.vz) = v
+        self.m = m
+
+
+def bodies_from(bodies):
+    '''
+        list of Body from a BODIES style dict, in its order
+    '''
+    return [Body(name, r, v, m) for (name, (r, v, m)) in bodies.items()]
+
+
+def to_dict(bodies):
+    '''
+        BODIES style dict of the current state
+    '''
+    return {b.name: ([b.x, b.y, b.z], [b.vx, b.vy, b.vz], b.m) for b in bodies}
+
+
+def make_pairs(bodies):
+    '''
+        precompute all i<j pairs as (Body, Body, m1, m2)
+    '''
+    return tuple((b1, b2, b1.m, b2.m)
+                 for (k, b1) in enumerate(bodies) for b2 in bodies[k + 1:])
+
+
+def advance(bodies, pairs, dt, iterations=1):
+    '''
+        advance the system iterations timesteps
+    '''
+    for _ in range(iterations):
+        for (b1, b2, m1, m2) in pairs:
+            dx = b1.x - b2.x
+            dy = b1.y - b2.y
+            dz = b1.z - b2.z
+
+            ########### update_vs ###########
+            mag = dt * ((dx * dx + dy * dy + dz * dz) ** (-1.5))
+            s1 = m2 * mag
+            s2 = m1 * mag
+            b1.vx -= dx * s1
+            b1.vy -= dy * s1
+            b1.vz -= dz * s1
+            b2.vx += dx * s2
+            b2.vy += dy * s2
+            b2.vz += dz * s2
+            ############# end ###############
+
+        for b in bodies:
+            ########### update_rs #############
+            b.x += dt * b.vx
+            b.y += dt * b.vy
+            b.z += dt * b.vz
+            ############## end ################
+
+
+def report_energy(bodies, pairs, e=0.0):
+    '''
+        compute the energy and return it so that it can be printed
+    '''
+    for (b1, b2, m1, m2) in pairs:
+        dx = b1.x - b2.x
+        dy = b1.y - b2.y
+        dz = b1.z - b2.z
+        ########### compute_energy ############
+        e -= (m1 * m2) / ((dx * dx + dy * dy + dz * dz) ** 0.5)
+        ################ end ##################
+
+    for b in bodies:
+        e += b.m * (b.vx * b.vx + b.vy * b.vy + b.vz * b.vz) / 2.
+    return e
+
+
+def offset_momentum(bodies, ref, px=0.0, py=0.0, pz=0.0):
+    '''
+        ref is the Body in the center of the system
+        offset values from this reference
+    '''
+    for b in bodies:
+        px -= b.vx * b.m
+        py -= b.vy * b.m
+        pz -= b.vz * b.m
+    ref.vx = px / ref.m
+    ref.vy = py / ref.m
+    ref.vz = pz / ref.m
+
+
+def nbody(loops, reference, iterations):
+    '''
+        nbody simulation
+        loops - number of loops to run
+        reference - body at center of system
+        iterations - number of timesteps to advance
+    '''
+    bodies = bodies_from(BODIES)
+    pairs = make_pairs(bodies)
+
+    # Set up global state
+    offset_momentum(bodies, [b for b in bodies if b.name == reference][0])
+
+    for _ in range(loops):
+        advance(bodies, pairs, 0.01, iterations)
+        print(report_energy(bodies, pairs))
+
+
+def _engines():
+    import copy
+    from itertools import combinations
+
+    import nbody_iter
+    import nbody_opt
+
+    def dict_engine(step):
+        bodies = copy.deepcopy(BODIES)
+        pairs = set(combinations(bodies.keys(), 2))
+        nbody_opt.offset_momentum(bodies, bodies['sun'])
+        return lambda iterations: step(bodies, pairs, iterations)
+
+    def slots_engine():
+        bodies = bodies_from(BODIES)
+        pairs = make_pairs(bodies)
+        offset_momentum(bodies, bodies[0])
+        return lambda iterations: advance(bodies, pairs, 0.01, iterations)
+
+    def opt_step(bodies, pairs, iterations):
+        for _ in range(iterations):
+            nbody_opt.advance(bodies, pairs, 0.01)
+
+    return (('nbody_opt', lambda: dict_engine(opt_step)),
+            ('nbody_iter', lambda: dict_engine(
+                lambda bodies, pairs, n: nbody_iter.advance(bodies, pairs, 0.01, n))),
+            ('nbody_slots', slots_engine))
+
+
+_BUILD = ('BUILD_TUPLE', 'BUILD_LIST', 'BUILD_MAP', 'BUILD_SET', 'LIST_APPEND', 'LIST_EXTEND')
+
+
+def count_objects(run):
+    '''
+        (containers built, float results) of the opcodes executed by run()
+        in the engine modules
+    '''
+    import dis
+
+    counts = {'containers': 0, 'floats': 0}
+    watched = {os.path.abspath(__file__)} | {
+        os.path.abspath(sys.modules[name].__file__) for name in ('nbody_opt', 'nbody_iter')}
+
+    def trace(frame, event, arg):
+        if os.path.abspath(frame.f_code.co_filename) not in watched:
+            return None
+        frame.f_trace_opcodes = True
+        if event == 'opcode':
+            op = dis.opname[frame.f_code.co_code[frame.f_lasti]]
+            if op in _BUILD:
+                counts['containers'] += 1
+            elif op == 'BINARY_OP':
+                counts['floats'] += 1
+        return trace
+
+    sys.settrace(trace)
+    try:
+        run()
+    finally:
+        sys.settrace(None)
+    return counts
+
+
+def _timings(iterations):
+    # {engine: seconds for iterations steps}
+    times = {}
+    for (name, make) in _engines():
+        step = make()
+        step(100)
+        start = time.perf_counter()
+        step(iterations)
+        times[name] = time.perf_counter() - start
+    return times
+
+
+def benchmark(iterations=20000):
+    '''
+        time iterations steps of nbody_opt, nbody_iter and nbody_slots under this
+        interpreter and under PyPy when it is installed, and count the containers and
+        floats created per step under this interpreter
+    '''
+    times = _timings(iterations)
+    implementation = sys.implementation.name
+    print('%12s %10s %10s %11s %8s' % ('engine', 'python', 'seconds', 'containers', 'floats'))
+    for (name, make) in _engines():
+        step = make()
+        counts = count_objects(lambda: step(1)) if implementation == 'cpython' else None
+        print('%12s %10s %10.3f %11s %8s' % (
+            name, implementation, times[name],
+            counts['containers'] if counts else '-', counts['floats'] if counts else '-'))
+
+    pypy = os.environ.get('PYPY') or shutil.which('pypy3') or shutil.which('pypy')
+    if implementation != 'pypy' and pypy:
+        out = subprocess.run([pypy, '-c', 'import json, nbody_slots; '
+                              'print(json.dumps(nbody_slots._timings(%d)))' % iterations],
+                             stdout=subprocess.PIPE, cwd=os.path.dirname(os.path.abspath(__file__)),
+                             check=True)
+        import json
+        for (name, seconds) in json.loads(out.stdout.decode()).items():
+            print('%12s %10s %10.3f %11s %8s' % (name, 'pypy', seconds, '-', '-'))
+    elif implementation != 'pypy':
+        print('pypy not found, set PYPY to its path for the PyPy timings')
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--benchmark':
+        benchmark()
+    else:
+        nbody(100, 'sun', 20000)
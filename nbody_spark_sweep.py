@@ -0,0 +1,135 @@
+"""
+    N-body simulation.
+
+    parameter sweep of perturbed BODIES ensembles with PySpark (local mode, like
+    distinct_spark.py and product_spark.py)
+
+    1. the grid is every (perturbation scale, dt, integrator) combination, each with
+       `members` randomly perturbed copies of BODIES; every member is one record
+       ((dt, integrator), (scale, seed)) of an RDD
+    2. the RDD is partitioned by (dt, integrator), one partition per combination, so that
+       mapPartitions can stack all the members of a partition into one nbody_ensemble
+       system and advance them together with nbody_integrators.integrate: one numpy pass
+       per force evaluation for the whole partition instead of one interpreter loop per
+       member
+    3. a member's perturbation only depends on its seed, so the result does not depend on
+       how the grid is partitioned (up to the rounding of the ensemble sums); run_partition
+       is plain numpy and runs without Spark
+    4. every member runs for the same simulated time (`years`), so the error of the final
+       energy compares the integrators and timesteps at equal cost in physical time
+    5. the executors return one row per member; the driver reduces them by
+       (scale, dt, integrator) to the median and max relative energy error and prints
+       the summary table; the members of an ensemble share its time equally, so a cell's
+       time is its members' share of their partition's ensemble, not the whole partition
+
+    run_partition over the default grid (3600 members, 1 year), single core, no Spark:
+    one ensemble per (dt, integrator): 1.3s
+    one member at a time: 78s
+
+        spark-submit nbody_spark_sweep.py
+"""
+
+import time
+from collections import defaultdict
+
+import numpy as np
+
+import nbody_ensemble
+import nbody_numpy
+from nbody_integrators import integrate
+from nbody_opt import BODIES
+
+SCALES = (1e-6, 1e-4, 1e-2)
+DTS = (0.04, 0.01, 0.0025)
+INTEGRATORS = ('euler', 'leapfrog', 'yoshida4', 'forest-ruth')
+
+
+def grid(scales=SCALES, dts=DTS, integrators=INTEGRATORS, members=100, seed=0):
+    '''
+        records ((dt, integrator), (scale, seed)) of every member of the sweep
+    '''
+    seeds = iter(range(seed, seed + len(scales) * len(dts) * len(integrators) * members))
+    return [((dt, integrator), (scale, next(seeds)))
+            for scale in scales for dt in dts for integrator in integrators
+            for _ in range(members)]
+
+
+def _member(bodies, scale, seed):
+    # one perturbed copy of bodies, shaped (1,N,3)
+    (r, v, m) = nbody_ensemble.perturbed_systems(bodies, 1, scale, seed)
+    return r, v
+
+
+def run_partition(records, years=1., reference='sun'):
+    '''
+        advance the members of records, grouped by (dt, integrator) into one ensemble
+        each, for `years`; yields (scale, dt, integrator, seed, relative energy error,
+        the member's share of the seconds of its ensemble)
+    '''
+    names, bodies = nbody_numpy.arrays_from_bodies(BODIES)
+    pairs = nbody_numpy.make_pairs(len(names))
+
+    groups = defaultdict(list)
+    for (key, member) in records:
+        groups[key].append(member)
+
+    for ((dt, integrator), members) in groups.items():
+        start = time.perf_counter()
+        (r, v) = zip(*[_member(bodies, scale, seed) for (scale, seed) in members])
+        ensemble = (np.concatenate(r), np.concatenate(v), bodies[2].copy())
+        nbody_ensemble.offset_momentum(ensemble, names.index(reference))
+
+        e0 = nbody_ensemble.report_energy(ensemble, pairs)
+        integrate(ensemble, pairs, dt, int(round(years / dt)), integrator,
+                  nbody_ensemble.accelerations)
+        error = np.abs(nbody_ensemble.report_energy(ensemble, pairs) / e0 - 1.)
+        seconds = (time.perf_counter() - start) / len(members)
+
+        for ((scale, seed), err) in zip(members, error):
+            yield (scale, dt, integrator, seed, float(err), seconds)
+
+
+def summarize(rows):
+    '''
+        [(scale, dt, integrator, members, median error, max error, seconds)] sorted by
+        scale, integrator and dt; seconds is the sum of the members' shares of their
+        ensembles' time
+    '''
+    cells = defaultdict(list)
+    seconds = defaultdict(float)
+    for (scale, dt, integrator, seed, err, share) in rows:
+        cells[(scale, dt, integrator)].append(err)
+        seconds[(scale, dt, integrator)] += share
+    return [(scale, dt, integrator, len(errors), float(np.median(errors)), max(errors),
+             seconds[(scale, dt, integrator)])
+            for ((scale, dt, integrator), errors) in
+            sorted(cells.items(), key=lambda item: (item[0][0], item[0][2], -item[0][1]))]
+
+
+def print_table(summary):
+    print('%10s %12s %8s %8s %12s %12s %10s' % ('scale', 'integrator', 'dt', 'members',
+                                               'median err', 'max err', 'time (s)'))
+    for (scale, dt, integrator, members, median, worst, seconds) in summary:
+        print('%10g %12s %8g %8d %12.3e %12.3e %10.3f' % (scale, integrator, dt, members,
+                                                          median, worst, seconds))
+
+
+def sweep(sc, records, years=1.):
+    '''
+        run the records on the executors of sc, one ensemble per (dt, integrator)
+        partition, and return the summary table
+    '''
+    keys = sorted(set(key for (key, _) in records))
+    index = {key: k for (k, key) in enumerate(keys)}
+    rows = (sc.parallelize(records)
+              .partitionBy(len(keys), lambda key: index[key])
+              .mapPartitions(lambda part: run_partition(part, years))
+              .collect())
+    return summarize(rows)
+
+if __name__ == '__main__':
+    from pyspark import SparkContext
+
+    sc = SparkContext("local", "nbodysweep")
+
+    print_table(sweep(sc, grid(), years=1.))
@@ -0,0 +1,217 @@
+"""
+    N-body simulation.
+
+    background trajectory writer
+
+    1. snapshot() copies the positions into one of a ring of preallocated chunk buffers,
+       which is all the integration loop pays for a snapshot
+    2. full buffers are handed to a background thread that appends them to the file and
+       hands them back; when every buffer is waiting to be written snapshot() blocks
+    3. the file is a plain .npy of shape (frames, N, 3) whose header is rewritten in place
+       after every chunk, so np.load(path, mmap_mode='r') maps it without loading it,
+       even while the run is still going
+    4. a second .npy next to it indexes every frame with its step and time
+    5. a resumed run (see nbody_checkpoint) reopens both files, drops the frames after
+       the step it resumes from and appends to them
+    6. flush() hands over the partial buffer and waits for the thread; nbody_numpy calls
+       it before every checkpoint, so no frame before a checkpoint is lost with the process
+"""
+
+import os
+import queue
+import threading
+
+import numpy as np
+
+MAGIC = b'\x93NUMPY\x01\x00'
+# bytes reserved for the header, so it can be rewritten in place as frames are added
+HEADER_SIZE = 128
+
+
+def _header(descr, shape):
+    '''
+        a version 1.0 .npy header padded to HEADER_SIZE bytes
+    '''
+    text = "{'descr': %r, 'fortran_order': False, 'shape': %r, }" % (descr, shape)
+    pad = HEADER_SIZE - len(MAGIC) - 2 - len(text) - 1
+    if pad < 0:
+        raise ValueError('header for shape %r does not fit in %d bytes' % (shape, HEADER_SIZE))
+    text = text + ' ' * pad + '\n'
+    return MAGIC + np.uint16(len(text)).tobytes() + text.encode('latin1')
+
+
+def index_path(path):
+    '''
+        path of the index file of the trajectory at path
+    '''
+    (stem, ext) = os.path.splitext(path)
+    return stem + '.index' + (ext or '.npy')
+
+
+INDEX = np.dtype([('step', '<i8'), ('time', '<f8')])
+
+
+class _AppendableNpy(object):
+    '''
+        .npy file of records of shape item and type dtype that grows along its first axis
+        keep - reopen the existing file and keep its first keep records
+    '''
+
+    def __init__(self, path, dtype, item, keep=None):
+        self.dtype = np.dtype(dtype)
+        self.item = tuple(item)
+        if keep is None:
+            self.f = open(path, 'wb')
+            self.frames = 0
+            self.f.write(self._header())
+            return
+
+        self.f = open(path, 'r+b')
+        try:
+            np.lib.format.read_magic(self.f)
+            (shape, _, dtype) = np.lib.format.read_array_header_1_0(self.f)
+            if self.f.tell() != HEADER_SIZE or dtype != self.dtype or shape[1:] != self.item:
+                raise ValueError('%s: not a trajectory of %r %s records' % (
+                    path, self.item, self.dtype))
+            if keep > shape[0]:
+                raise ValueError('%s: cannot keep %d of %d records' % (path, keep, shape[0]))
+            self.frames = keep
+            self.f.truncate(HEADER_SIZE + keep * self.dtype.itemsize *
+                            int(np.prod(self.item, dtype=np.int64)))
+            self.f.seek(0)
+            self.f.write(self._header())
+            self.f.seek(0, os.SEEK_END)
+        except BaseException:
+            self.f.close()
+            raise
+
+    def _header(self):
+        return _header(np.lib.format.dtype_to_descr(self.dtype), (self.frames,) + self.item)
+
+    def append(self, block):
+        self.f.write(np.ascontiguousarray(block, dtype=self.dtype).tobytes())
+        self.frames += len(block)
+        self.f.seek(0)
+        self.f.write(self._header())
+        self.f.seek(0, os.SEEK_END)
+
+    def flush(self):
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+class TrajectoryWriter(object):
+    '''
+        stream position snapshots of n bodies to path from a background thread
+        every - keep one snapshot every this many steps
+        chunk - snapshots per buffer
+        buffers - number of preallocated buffers in the ring
+        resume - step a resumed run continues from: the frames of an existing trajectory
+                 at path up to and including it are kept and new ones appended to them
+    '''
+
+    def __init__(self, path, n, every=1, chunk=64, buffers=4, resume=None):
+        self.every = every
+        self.chunk = chunk
+        # snapshots at or before this step are already in the file
+        self.last = -1
+        keep = None
+        if resume is not None and os.path.exists(path) and os.path.exists(index_path(path)):
+            steps = np.load(index_path(path), mmap_mode='r')['step']
+            keep = int(np.searchsorted(steps, resume, side='right'))
+            if keep:
+                self.last = int(steps[keep - 1])
+        self.data = _AppendableNpy(path, np.float64, (n, 3), keep)
+        try:
+            self.index = _AppendableNpy(index_path(path), INDEX, (), keep)
+        except BaseException:
+            self.data.close()
+            raise
+
+        self.frames = [np.empty((chunk, n, 3)) for _ in range(buffers)]
+        self.stamps = [np.empty(chunk, dtype=INDEX) for _ in range(buffers)]
+        self.free = queue.Queue()
+        self.full = queue.Queue()
+        for b in range(1, buffers):
+            self.free.put(b)
+
+        self.current = 0
+        self.used = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            item = self.full.get()
+            if item is None:
+                break
+            (b, count) = item
+            try:
+                if self.error is None:
+                    self.data.append(self.frames[b][:count])
+                    self.index.append(self.stamps[b][:count])
+                    self.data.flush()
+                    self.index.flush()
+            except Exception as e:
+                self.error = e
+            self.free.put(b)
+            self.full.task_done()
+
+    def _hand_over(self):
+        self.full.put((self.current, self.used))
+        self.current = self.free.get()
+        self.used = 0
+        if self.error is not None:
+            raise self.error
+
+    def snapshot(self, r, step, time):
+        '''
+            record the positions r at the given step and time if step falls on the cadence
+        '''
+        if step % self.every or step <= self.last:
+            return
+        self.frames[self.current][self.used] = r
+        self.stamps[self.current][self.used] = (step, time)
+        self.used += 1
+        if self.used == self.chunk:
+            self._hand_over()
+
+    def flush(self):
+        '''
+            write the snapshots recorded so far and wait until they are in the file
+        '''
+        if self.used:
+            self._hand_over()
+        self.full.join()
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        '''
+            write what is left and stop the background thread
+        '''
+        if self.used:
+            self._hand_over()
+        self.full.put(None)
+        self.thread.join()
+        self.data.close()
+        self.index.close()
+        if self.error is not None:
+            raise self.error
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_trajectory(path):
+    '''
+        memory-map a trajectory without loading it
+        returns (positions shaped (frames, N, 3), index with step and time fields)
+    '''
+    return (np.load(path, mmap_mode='r'), np.load(index_path(path), mmap_mode='r'))
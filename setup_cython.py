@@ -0,0 +1,27 @@
+"""
+    build the nbody_cython extension in place:
+
+        python setup_cython.py build_ext --inplace
+
+    set NBODY_NO_OPENMP=1 to build without OpenMP (prange then runs serially)
+"""
+
+import os
+import sys
+
+from setuptools import setup, Extension
+from Cython.Build import cythonize
+
+if os.environ.get('NBODY_NO_OPENMP'):
+    openmp = []
+elif sys.platform == 'win32':
+    openmp = ['/openmp']
+else:
+    openmp = ['-fopenmp']
+
+extension = Extension('nbody_cython', ['nbody_cython.pyx'],
+                      extra_compile_args=['-O3'] + openmp,
+                      extra_link_args=openmp if sys.platform != 'win32' else [])
+
+setup(name='nbody_cython',
+      ext_modules=cythonize([extension], compiler_directives={'language_level': 3}))
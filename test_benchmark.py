@@ -0,0 +1,24 @@
+import unittest
+
+import benchmark
+
+
+class testBenchmark(unittest.TestCase):
+    def testCompare_FlagsSlowdownsPastThreshold(self):
+        baseline = {'results': {'a': {'[1]': {'warm': 1.0}, '[2]': {'warm': 1.0}},
+                                'b': {'[1]': {'skipped': 'missing'}}}}
+        current = {'results': {'a': {'[1]': {'warm': 1.1}, '[2]': {'warm': 1.5}},
+                               'b': {'[1]': {'warm': 9.0}}}}
+        self.assertEqual(benchmark.compare(current, baseline, 0.2), [('a', '[2]', 1.0, 1.5)])
+
+    def testRunSuite_RecordsWarmAndCold(self):
+        results = benchmark.run_suite(['binary.zbits'], repeat=1)
+        record = results['results']['binary.zbits']['[6, 3]']
+        self.assertGreater(record['warm'], 0)
+        self.assertGreater(record['cold'], 0)
+        self.assertIn('maxrss_kb', record)
+        self.assertGreaterEqual(results['machine']['cpus'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
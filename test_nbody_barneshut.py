@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+
+import nbody_numpy
+import nbody_barneshut
+
+
+class testBarnesHut(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        r = rng.normal(size=(500, 3))
+        self.bodies = (r, np.zeros_like(r), rng.uniform(0.5, 1.5, 500))
+        self.direct = nbody_numpy.accelerations(self.bodies, nbody_numpy.make_pairs(500))
+
+    def testTree_MassAndCenter(self):
+        (r, v, m) = self.bodies
+        tree = nbody_barneshut.build_tree(r, m, leaf_size=4)
+        self.assertAlmostEqual(tree['mass'][0], m.sum())
+        self.assertTrue(np.allclose(tree['com'][0], np.sum(m[:, None] * r, axis=0) / m.sum()))
+        self.assertEqual(sorted(tree['order']), list(range(500)))
+
+    def testThetaZero_IsDirect(self):
+        a = nbody_barneshut.accelerations(self.bodies, theta=0.)
+        self.assertTrue(np.allclose(a, self.direct, rtol=1e-10, atol=1e-12))
+
+    def testTheta_BoundsError(self):
+        a = nbody_barneshut.accelerations(self.bodies, theta=0.5)
+        err = np.linalg.norm(a - self.direct, axis=1) / np.linalg.norm(self.direct, axis=1)
+        self.assertLess(np.median(err), 1e-2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+
+import nbody_blockstep
+import nbody_integrators
+import nbody_numpy
+from nbody.initial import with_test_particles
+from nbody_opt import BODIES
+
+
+class testBlockstep(unittest.TestCase):
+    def setUp(self):
+        self.names, self.bodies = nbody_numpy.arrays_from_bodies(BODIES)
+        nbody_numpy.offset_momentum(self.bodies, 0)
+
+    def testLevelZero_IsLeapfrog(self):
+        block = tuple(x.copy() for x in self.bodies)
+        (evaluations, finest) = nbody_blockstep.integrate(block, 0.01, 100, max_level=0)
+        nbody_integrators.integrate(self.bodies, nbody_numpy.make_pairs(5), 0.01, 100,
+                                    'leapfrog', nbody_numpy.accelerations)
+        self.assertEqual((evaluations, finest), (5 * 101, 0))
+        for (x, y) in zip(block, self.bodies):
+            self.assertTrue(np.allclose(x, y, rtol=1e-12, atol=1e-14))
+
+    def testTestParticles_FewerEvaluations(self):
+        bodies = with_test_particles(self.bodies, 45, 1., 40., seed=0)
+        bodies = with_test_particles(bodies, 5, 0.1, 0.2, seed=1)
+        pairs = nbody_numpy.make_pairs(55)
+        e0 = nbody_numpy.report_energy(bodies, pairs)
+
+        (evaluations, finest) = nbody_blockstep.integrate(bodies, 0.04, 5)
+        global_step = 55 * (5 * 2 ** finest + 1)
+        self.assertGreater(finest, 3)
+        self.assertLess(evaluations, global_step / 5)
+        # the test particles are massless, the planets keep their energy
+        self.assertAlmostEqual(nbody_numpy.report_energy(bodies, pairs) / e0, 1., places=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
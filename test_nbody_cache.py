@@ -0,0 +1,83 @@
+import unittest
+import os
+import tempfile
+
+import nbody_numpy
+from nbody_cache import ResultCache, engine_version
+from nbody_cells import NeighbourList
+from nbody_opt import BODIES
+
+
+class testCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def testExtendsPrefixBitForBit(self):
+        names, bodies = nbody_numpy.arrays_from_bodies(BODIES)
+        nbody_numpy.offset_momentum(bodies, 0)
+        pairs = nbody_numpy.make_pairs(len(names))
+        cache = ResultCache(self.path('cache'))
+
+        def run(steps):
+            return cache.run(bodies, pairs, 0.01, steps, 'leapfrog', nbody_numpy.accelerations,
+                             every=100)
+        run(200)
+        (state, energies) = run(500)
+        self.assertEqual(cache.steps_run, 500)
+        self.assertEqual(run(500)[1], energies)
+        self.assertEqual(cache.hits, 1)
+
+        full = ResultCache(self.path('other')).run(bodies, pairs, 0.01, 500, 'leapfrog',
+                                                   nbody_numpy.accelerations, every=100)
+        self.assertEqual(full[1], energies)
+        for (x, y) in zip(full[0], state):
+            self.assertTrue((x == y).all())
+
+    def testKeyCoversEngineConfig(self):
+        coarse = engine_version(NeighbourList(8., skin=1.))
+        self.assertNotEqual(coarse, engine_version(NeighbourList(8., skin=2.)))
+        self.assertNotEqual(coarse, engine_version(NeighbourList(8., eps=0.1, skin=1.)))
+        # state that changes while it runs is not part of it
+        neighbours = NeighbourList(8., skin=1.)
+        neighbours(nbody_numpy.arrays_from_bodies(BODIES)[1], None)
+        self.assertEqual(engine_version(neighbours), coarse)
+
+    def testEvictsLeastRecentlyUsed(self):
+        names, bodies = nbody_numpy.arrays_from_bodies(BODIES)
+        pairs = nbody_numpy.make_pairs(len(names))
+        cache = ResultCache(self.path('cache'))
+        for dt in (0.01, 0.02, 0.03):
+            cache.run(bodies, pairs, dt, 10, 'euler', nbody_numpy.accelerations)
+        entries = sorted(os.listdir(self.path('cache')))
+        paths = [self.path(os.path.join('cache', name)) for name in entries]
+        for (age, path) in enumerate(paths):
+            os.utime(path, (age, age))
+        cache.max_bytes = sum(os.path.getsize(path) for path in paths[1:])
+        cache.evict()
+        self.assertEqual(sorted(os.listdir(self.path('cache'))), entries[1:])
+
+    def testStatefulEngine_RunsFromStart(self):
+        names, bodies = nbody_numpy.arrays_from_bodies(BODIES)
+        nbody_numpy.offset_momentum(bodies, 0)
+        cache = ResultCache(self.path('cache'))
+
+        def run(cache, steps):
+            return cache.run(bodies, None, 0.01, steps, 'leapfrog',
+                             NeighbourList(8., skin=0.05), every=100)
+        run(cache, 200)
+        (state, energies) = run(cache, 500)
+        self.assertEqual(cache.steps_run, 700)
+        (full, full_energies) = run(ResultCache(self.path('other')), 500)
+        self.assertEqual(full_energies, energies)
+        for (x, y) in zip(full, state):
+            self.assertTrue((x == y).all())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+import unittest
+
+import numpy as np
+
+import nbody_numpy
+import nbody_cells
+from nbody_integrators import integrate
+
+
+class testCells(unittest.TestCase):
+    def setUp(self):
+        self.bodies = nbody_cells._uniform(400, 32.)
+        self.pairs = nbody_numpy.make_pairs(400)
+
+    def testCellPairs_MatchAllPairs(self):
+        (r, v, m) = self.bodies
+        (i, j) = nbody_cells.cell_pairs(r, 0.8)
+        found = set(zip(np.minimum(i, j), np.maximum(i, j)))
+        self.assertEqual(len(found), len(i))
+        (i, j) = self.pairs
+        d = r[i] - r[j]
+        close = np.einsum('ij,ij->i', d, d) < 0.64
+        self.assertEqual(found, set(zip(i[close], j[close])))
+
+    def testNeighbourList_MatchesAllPairsRun(self):
+        direct = tuple(x.copy() for x in self.bodies)
+        cells = tuple(x.copy() for x in self.bodies)
+
+        def accel(bodies, pairs, potential=False):
+            return nbody_cells.accelerations(bodies, pairs, potential, 0.1, 1.)
+        neighbours = nbody_cells.NeighbourList(1., 0.1, skin=0.1)
+        integrate(direct, self.pairs, 0.01, 100, 'leapfrog', accel)
+        integrate(cells, None, 0.01, 100, 'leapfrog', neighbours)
+        self.assertGreater(neighbours.builds, 1)
+        self.assertTrue(np.allclose(cells[0], direct[0], rtol=1e-10, atol=1e-12))
+
+
+if __name__ == '__main__':
+    unittest.main()
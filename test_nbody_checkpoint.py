@@ -0,0 +1,50 @@
+import unittest
+import os
+import tempfile
+
+import numpy as np
+
+import nbody_numpy
+from nbody_checkpoint import Checkpoint
+
+
+class testCheckpoint(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def testSaveLoad(self):
+        r = np.arange(6.).reshape(2, 3)
+        ckpt = Checkpoint(self.path('a.ckpt'), 2)
+        ckpt.save((r, -r, np.ones(2)), 10, 1, 0.01, 'leapfrog')
+        ckpt.save((r + 1, -r, np.ones(2)), 20, 2, 0.01, 'leapfrog')
+        ckpt.close()
+
+        (bodies, step, loop, dt, integrator) = Checkpoint(self.path('a.ckpt')).load()
+        self.assertTrue((bodies[0] == r + 1).all())
+        self.assertEqual((step, loop, dt, integrator), (20, 2, 0.01, 'leapfrog'))
+
+    def testResume_BitForBit(self):
+        nbody_numpy.nbody(4, 'sun', 100, integrator='leapfrog', checkpoint=self.path('full.ckpt'))
+        nbody_numpy.nbody(2, 'sun', 100, integrator='leapfrog', checkpoint=self.path('part.ckpt'))
+        nbody_numpy.nbody(4, 'sun', 100, resume=self.path('part.ckpt'))
+
+        full = Checkpoint(self.path('full.ckpt')).load()
+        part = Checkpoint(self.path('part.ckpt')).load()
+        self.assertEqual(full[1:], part[1:])
+        for (x, y) in zip(full[0], part[0]):
+            self.assertTrue((x == y).all())
+
+    def testResume_OtherIterationsRejected(self):
+        nbody_numpy.nbody(2, 'sun', 100, checkpoint=self.path('part.ckpt'))
+        self.assertRaises(ValueError, nbody_numpy.nbody, 4, 'sun', 50,
+                          resume=self.path('part.ckpt'))
+
+
+if __name__ == '__main__':
+    unittest.main()
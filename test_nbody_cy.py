@@ -0,0 +1,53 @@
+import unittest
+
+import numpy as np
+
+import nbody_cy
+import nbody_numpy
+
+
+def cluster(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(-1., 1., (n, 3)), rng.standard_normal((n, 3)) * 0.1,
+            rng.uniform(1e-4, 1e-3, n))
+
+
+class testNbodyCy(unittest.TestCase):
+    def assertMatchesNumpy(self, advance, n, iterations=10, dt=0.001):
+        (r, v, m) = cluster(n)
+        reference = (r.copy(), v.copy(), m.copy())
+        pairs = nbody_numpy.make_pairs(n)
+        for _ in range(iterations):
+            nbody_numpy.advance(reference, pairs, dt)
+
+        advance(r, v, m, iterations, dt)
+        self.assertTrue(np.allclose(r, reference[0], rtol=1e-9, atol=1e-12))
+        self.assertTrue(np.allclose(v, reference[1], rtol=1e-9, atol=1e-12))
+
+    def testAdvance_MatchesNumpy(self):
+        self.assertMatchesNumpy(nbody_cy.advance, 50)
+
+    def testAdvanceParallel_MatchesNumpy(self):
+        self.assertMatchesNumpy(nbody_cy.advance_parallel, nbody_cy.PARALLEL_THRESHOLD)
+
+    def testEnergy_MatchesNumpy(self):
+        (r, v, m) = cluster(50)
+        self.assertAlmostEqual(nbody_cy.report_energy(r, v, m),
+                               nbody_numpy.report_energy((r, v, m), nbody_numpy.make_pairs(50)),
+                               places=12)
+
+    @unittest.skipUnless(nbody_cy.COMPILED, 'nbody_cython is not built')
+    def testBadShapes_Raise(self):
+        (r, v, m) = cluster(3)
+        with self.assertRaises(ValueError):
+            nbody_cy.advance(np.ascontiguousarray(r[:, :2]), v, m, 1, 0.01)
+        with self.assertRaises(ValueError):
+            nbody_cy.advance_parallel(r, v, m[:2].copy(), 1, 0.01)
+        with self.assertRaises(ValueError):
+            nbody_cy.report_energy(r, np.zeros((2, 3)), m)
+        with self.assertRaises(ValueError):
+            nbody_cy.offset_momentum(v, m, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
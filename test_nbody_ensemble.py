@@ -0,0 +1,41 @@
+import unittest
+
+import numpy as np
+
+import nbody_ensemble
+import nbody_numpy
+from nbody_opt import BODIES
+
+
+class testEnsemble(unittest.TestCase):
+    def setUp(self):
+        self.names, self.bodies = nbody_numpy.arrays_from_bodies(BODIES)
+        self.pairs = nbody_numpy.make_pairs(len(self.names))
+        self.ensemble = nbody_ensemble.perturbed_systems(self.bodies, 8, 1e-3, seed=0)
+        nbody_ensemble.offset_momentum(self.ensemble, 0)
+
+    def testOffsetMomentum_ZeroPerMember(self):
+        (r, v, m) = self.ensemble
+        p = np.sum(v * m[:, None], axis=1)
+        self.assertEqual(p.shape, (8, 3))
+        self.assertTrue(np.allclose(p, 0., atol=1e-15))
+
+    def testAdvance_MatchesSeparateRuns(self):
+        (r, v, m) = self.ensemble
+        members = [(r[b].copy(), v[b].copy(), m.copy()) for b in range(8)]
+        for _ in range(100):
+            nbody_ensemble.advance(self.ensemble, self.pairs, 0.01)
+            for member in members:
+                nbody_numpy.advance(member, self.pairs, 0.01)
+
+        energies = nbody_ensemble.report_energy(self.ensemble, self.pairs)
+        for (b, member) in enumerate(members):
+            self.assertTrue((r[b] == member[0]).all(), b)
+            self.assertTrue((v[b] == member[1]).all(), b)
+            # the state is bit for bit, the energy sums are ordered differently
+            self.assertAlmostEqual(energies[b], nbody_numpy.report_energy(member, self.pairs),
+                                   places=14)
+
+
+if __name__ == '__main__':
+    unittest.main()
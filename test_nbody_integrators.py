@@ -0,0 +1,84 @@
+import unittest
+
+import nbody_barneshut
+import nbody_numpy
+import nbody_pm
+import nbody_integrators
+import nbody_tiled
+from nbody_cells import NeighbourList
+from nbody_profile import Profile
+from nbody_opt import BODIES
+
+
+class testIntegrators(unittest.TestCase):
+    def setUp(self):
+        self.names, self.initial = nbody_numpy.arrays_from_bodies(BODIES)
+        nbody_numpy.offset_momentum(self.initial, self.names.index('sun'))
+        self.pairs = nbody_numpy.make_pairs(len(self.names))
+        self.e0 = nbody_numpy.report_energy(self.initial, self.pairs)
+
+    def error(self, integrator, dt, years=2.):
+        bodies = tuple(x.copy() for x in self.initial)
+        nbody_integrators.integrate(bodies, self.pairs, dt, int(round(years / dt)),
+                                    integrator, nbody_numpy.accelerations)
+        return abs(nbody_numpy.report_energy(bodies, self.pairs) / self.e0 - 1.)
+
+    def testEuler_MatchesAdvance(self):
+        bodies = tuple(x.copy() for x in self.initial)
+        nbody_integrators.integrate(bodies, self.pairs, 0.01, 50, 'euler',
+                                    nbody_numpy.accelerations)
+        for _ in range(50):
+            nbody_numpy.advance(self.initial, self.pairs, 0.01)
+        for (x, y) in zip(bodies, self.initial):
+            self.assertTrue((x == y).all())
+
+    def testOrder(self):
+        for (integrator, order) in (('leapfrog', 2), ('yoshida4', 4), ('forest-ruth', 4)):
+            ratio = self.error(integrator, 0.04) / self.error(integrator, 0.02)
+            self.assertGreater(ratio, 2 ** order * 0.7, integrator)
+
+    def testEnergy_NeedsPotential(self):
+        bodies = tuple(x.copy() for x in self.initial)
+        for accel in (nbody_barneshut.accelerations, nbody_pm.accelerations):
+            self.assertRaises(ValueError, nbody_integrators.integrate, bodies, self.pairs,
+                              0.01, 10, 'leapfrog', accel, energy_every=5)
+        # without energies they are fine
+        nbody_integrators.integrate(bodies, self.pairs, 0.01, 2, 'leapfrog',
+                                    nbody_barneshut.accelerations)
+
+    def testProfile_SameResultAndCounts(self):
+        bodies = tuple(x.copy() for x in self.initial)
+        profile = Profile()
+        with profile:
+            nbody_integrators.integrate(bodies, self.pairs, 0.01, 50, 'leapfrog',
+                                        profile.accel(nbody_numpy.accelerations),
+                                        profile.callback(None), energy_every=10)
+        nbody_integrators.integrate(self.initial, self.pairs, 0.01, 50, 'leapfrog',
+                                    nbody_numpy.accelerations, energy_every=10)
+        for (x, y) in zip(bodies, self.initial):
+            self.assertTrue((x == y).all())
+        summary = profile.summary()
+        self.assertEqual(summary['steps'], 50)
+        self.assertEqual(summary['phases']['energy']['calls'], 5)
+        self.assertEqual(summary['phases']['force']['calls'], 46)
+        self.assertEqual(summary['pair_interactions'], 51 * 10)
+
+    def testProfile_CountsPairsEvaluated(self):
+        profile = Profile()
+        with profile:
+            nbody_integrators.integrate(self.initial, None, 0.01, 4, 'euler',
+                                        profile.accel(nbody_tiled.accelerations))
+        self.assertEqual(profile.summary()['pair_interactions'], 4 * 10)
+
+        # only the sun, jupiter and saturn are within cutoff + skin of each other
+        neighbours = NeighbourList(cutoff=8.)
+        profile = Profile()
+        with profile:
+            nbody_integrators.integrate(self.initial, self.pairs, 0.01, 4, 'euler',
+                                        profile.accel(neighbours))
+        self.assertEqual(profile.summary()['pair_interactions'], 4 * neighbours.npairs)
+        self.assertEqual(neighbours.npairs, 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,57 @@
+import unittest
+import contextlib
+import io
+
+import numpy as np
+
+import nbody_mpi
+import nbody_numpy
+
+
+class _Rank(object):
+    # rank of a communicator of the given size, for scatter_bodies
+    def __init__(self, rank, size):
+        self.rank = rank
+        self.size = size
+
+    def Get_rank(self):
+        return self.rank
+
+    def Get_size(self):
+        return self.size
+
+
+class testMpi(unittest.TestCase):
+    def testNbody_MatchesNumpy(self):
+        energies = []
+        for run in (nbody_mpi.nbody, nbody_numpy.nbody):
+            out = io.StringIO()
+            with contextlib.redirect_stdout(out):
+                run(3, 'sun', 200)
+            energies.append([float(e) for e in out.getvalue().split()])
+        self.assertEqual(len(energies[0]), 3)
+        for (x, y) in zip(*energies):
+            self.assertAlmostEqual(x, y, places=12)
+
+    def testScatter_UnevenPadding(self):
+        bodies = nbody_mpi._random_bodies(7)
+        (r, v, m) = bodies
+        blocks = [nbody_mpi.scatter_bodies(_Rank(rank, 3), bodies) for rank in range(3)]
+        self.assertEqual([n for (_, _, n) in blocks], [2, 2, 3])
+        self.assertEqual({local.shape for (local, _, _) in blocks}, {(3, 4)})
+
+        real = np.concatenate([local[:n] for (local, _, n) in blocks])
+        self.assertTrue((real[:, :3] == r).all())
+        self.assertTrue((real[:, 3] == m).all())
+        self.assertTrue((np.concatenate([lv[:n] for (_, lv, n) in blocks]) == v).all())
+
+        # the padding is massless and does not pull on anything
+        padded = np.concatenate([local for (local, _, _) in blocks])
+        self.assertEqual(np.count_nonzero(padded[:, 3]), 7)
+        a = nbody_mpi._block_accelerations(padded, padded, True)
+        expected = nbody_numpy.accelerations(bodies, nbody_numpy.make_pairs(7))
+        self.assertTrue(np.allclose(a[padded[:, 3] > 0], expected, rtol=1e-12, atol=0.))
+
+
+if __name__ == '__main__':
+    unittest.main()
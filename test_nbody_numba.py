@@ -0,0 +1,48 @@
+import unittest
+
+import numpy as np
+
+import nbody_numba
+import nbody_numpy
+
+
+def cluster(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return (rng.uniform(-1., 1., (n, 3)), rng.standard_normal((n, 3)) * 0.1,
+            rng.uniform(1e-4, 1e-3, n))
+
+
+class testNbodyNumba(unittest.TestCase):
+    def assertMatchesNumpy(self, advance, n, iterations=10, dt=0.001):
+        (r, v, m) = cluster(n)
+        reference = (r.copy(), v.copy(), m.copy())
+        pairs = nbody_numpy.make_pairs(n)
+        for _ in range(iterations):
+            nbody_numpy.advance(reference, pairs, dt)
+
+        advance(r, v, m, iterations, dt)
+        self.assertTrue(np.allclose(r, reference[0], rtol=1e-9, atol=1e-12))
+        self.assertTrue(np.allclose(v, reference[1], rtol=1e-9, atol=1e-12))
+
+    def testAdvance_MatchesNumpy(self):
+        self.assertMatchesNumpy(nbody_numba.advance, 50)
+
+    def testAdvanceParallel_MatchesNumpy(self):
+        self.assertMatchesNumpy(nbody_numba.advance_parallel, nbody_numba.PARALLEL_THRESHOLD)
+
+    def testEnergy_MatchesNumpy(self):
+        (r, v, m) = cluster(50)
+        self.assertAlmostEqual(nbody_numba.report_energy(r, v, m),
+                               nbody_numpy.report_energy((r, v, m), nbody_numpy.make_pairs(50)),
+                               places=12)
+
+    def testOffsetMomentum(self):
+        (r, v, m) = cluster(50)
+        # the reference body starts at rest, as the sun does in BODIES
+        v[0] = 0.
+        nbody_numba.offset_momentum(v, m, 0)
+        self.assertTrue(np.allclose(np.sum(v * m[:, None], axis=0), 0.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import unittest
+import copy
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from itertools import combinations
+from unittest import mock
+
+import numpy as np
+
+import nbody_opt
+import nbody_numpy
+import nbody_mixed
+import nbody_tiled
+from nbody_integrators import integrate
+
+
+class testNbodyNumpy(unittest.TestCase):
+    def setUp(self):
+        self.bodies = copy.deepcopy(nbody_opt.BODIES)
+        self.pairs = set(combinations(self.bodies.keys(), 2))
+        nbody_opt.offset_momentum(self.bodies, self.bodies['sun'])
+
+        self.names, self.state = nbody_numpy.arrays_from_bodies(nbody_opt.BODIES)
+        self.index_pairs = nbody_numpy.make_pairs(len(self.names))
+        nbody_numpy.offset_momentum(self.state, self.names.index('sun'))
+
+    def testOffsetMomentum(self):
+        (r, v, m) = self.state
+        self.assertTrue(np.allclose(np.sum(v * m[:, None], axis=0), 0.0))
+
+    def testEnergy_MatchesOpt(self):
+        self.assertAlmostEqual(nbody_numpy.report_energy(self.state, self.index_pairs),
+                               nbody_opt.report_energy(self.bodies, self.pairs), places=12)
+
+    def testAdvance_MatchesOpt(self):
+        for _ in range(1000):
+            nbody_opt.advance(self.bodies, self.pairs, 0.01)
+            nbody_numpy.advance(self.state, self.index_pairs, 0.01)
+
+        (r, v, m) = self.state
+        for k, name in enumerate(self.names):
+            self.assertTrue(np.allclose(r[k], self.bodies[name][0], rtol=1e-9, atol=1e-12))
+            self.assertTrue(np.allclose(v[k], self.bodies[name][1], rtol=1e-9, atol=1e-12))
+        self.assertAlmostEqual(nbody_numpy.report_energy(self.state, self.index_pairs),
+                               nbody_opt.report_energy(self.bodies, self.pairs), places=10)
+
+    def testMixed_TracksFloat64(self):
+        reference = tuple(x.copy() for x in self.state)
+        mixed = tuple(x.copy() for x in self.state)
+        compensated = nbody_mixed.CompensatedState(self.state)
+        integrate(reference, self.index_pairs, 0.01, 1000, 'leapfrog', nbody_numpy.accelerations)
+        for bodies in (mixed, compensated):
+            integrate(bodies, self.index_pairs, 0.01, 1000, 'leapfrog',
+                      nbody_mixed.accelerations)
+        e = nbody_numpy.report_energy(reference, self.index_pairs)
+        self.assertAlmostEqual(nbody_numpy.report_energy(mixed, self.index_pairs), e, places=7)
+        self.assertAlmostEqual(
+            nbody_numpy.report_energy(compensated.to_float64(), self.index_pairs), e, places=7)
+        self.assertAlmostEqual(nbody_mixed.report_energy(self.state, self.index_pairs),
+                               nbody_numpy.report_energy(self.state, self.index_pairs), places=6)
+
+    def testCompensated_IndexedUpdates(self):
+        compensated = nbody_mixed.CompensatedState(self.state)
+        (r, v, m) = compensated
+        self.assertEqual(r.c.dtype, np.float32)
+        for _ in range(1000):
+            v[0] += 1e-9
+            v[np.array([False, True, True, False, False])] += 1e-9
+        expected = self.state[1].copy()
+        expected[:3] += 1e-6
+        self.assertTrue(np.allclose(compensated.to_float64()[1], expected, rtol=0., atol=1e-11))
+
+    def testMixed_CompensatedStateIndexedAsPlainArrays(self):
+        compensated = nbody_mixed.CompensatedState(self.state)
+        calls = []
+        getitem = nbody_mixed._Compensated.__getitem__
+
+        def counted(array, index):
+            calls.append(index)
+            return getitem(array, index)
+
+        with mock.patch.object(nbody_mixed._Compensated, '__getitem__', counted):
+            (a, e) = nbody_mixed.accelerations(compensated, self.index_pairs, potential=True)
+        self.assertEqual(calls, [])
+        self.assertIs(type(a), np.ndarray)
+        self.assertTrue(np.allclose(a, nbody_numpy.accelerations(self.state, self.index_pairs),
+                                    rtol=1e-5))
+
+    def testTiled_MatchesNumpy(self):
+        rng = np.random.default_rng(0)
+        bodies = (rng.uniform(-1., 1., (100, 3)), np.zeros((100, 3)), rng.uniform(0.5, 1., 100))
+        pairs = nbody_numpy.make_pairs(100)
+        (a, e) = nbody_numpy.accelerations(bodies, pairs, potential=True)
+        for tile in (7, 32, 100, 128):
+            (at, et) = nbody_tiled.accelerations(bodies, potential=True, tile=tile)
+            self.assertTrue(np.allclose(at, a, rtol=1e-12, atol=0.), tile)
+            self.assertAlmostEqual(et / e, 1., places=12)
+
+    def testTiled_AutotuneSavedPerHost(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tiled.json')
+            saved = (nbody_tiled.TILE, nbody_tiled.tuned, nbody_tiled.TUNE_FILE)
+            nbody_tiled.TUNE_FILE = path
+            try:
+                tile = nbody_tiled.autotune(64, candidates=(16, 32), repeat=1)
+            finally:
+                (nbody_tiled.TILE, nbody_tiled.tuned, nbody_tiled.TUNE_FILE) = saved
+            with open(path) as f:
+                self.assertEqual(json.load(f), {nbody_tiled.host(): tile})
+
+            # the saved size is only read by tile_size(), not at import
+            out = subprocess.check_output(
+                [sys.executable, '-c', 'import nbody_tiled; '
+                 'print(nbody_tiled.TILE, nbody_tiled.tuned, nbody_tiled.tile_size())'],
+                env=dict(os.environ, NBODY_TILE_CACHE=path))
+            self.assertEqual(out.split(), [b'128', b'False', str(tile).encode()])
+
+    def testTiled_NoAutotuneAsSideEffect(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'tiled.json')
+            saved = (nbody_tiled.TILE, nbody_tiled.tuned, nbody_tiled.TUNE_FILE)
+            nbody_tiled.TUNE_FILE = path
+            try:
+                self.assertEqual(nbody_tiled.tile_size(), nbody_tiled.TILE)
+                nbody_tiled.fastest_tile(64, candidates=(16, 32), repeat=1)
+                self.assertEqual((nbody_tiled.TILE, nbody_tiled.tuned), saved[:2])
+            finally:
+                (nbody_tiled.TILE, nbody_tiled.tuned, nbody_tiled.TUNE_FILE) = saved
+            self.assertFalse(os.path.exists(path))
+
+
+if __name__ == '__main__':
+    unittest.main()
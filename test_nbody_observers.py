@@ -0,0 +1,51 @@
+import threading
+import unittest
+
+import nbody_numpy
+import nbody_observers
+from nbody_integrators import integrate
+from nbody_opt import BODIES
+
+
+class testObservers(unittest.TestCase):
+    def setUp(self):
+        self.names, self.bodies = nbody_numpy.arrays_from_bodies(BODIES)
+        nbody_numpy.offset_momentum(self.bodies, self.names.index('sun'))
+        self.pairs = nbody_numpy.make_pairs(len(self.names))
+
+    def testEnergy_MatchesFusedEnergy(self):
+        fused = []
+        with nbody_observers.Observers([nbody_observers.energy], every=100, workers=2) as obs:
+            callback = obs.callback(self.bodies, 0.01)
+
+            def both(step, e):
+                callback(step, e)
+                if e is not None:
+                    fused.append((step, float(e)))
+            integrate(self.bodies, self.pairs, 0.01, 1000, 'leapfrog', nbody_numpy.accelerations,
+                      both, energy_every=100)
+        observed = obs.results()['energy']
+        self.assertEqual([step for (step, e) in observed], [step for (step, e) in fused])
+        for ((_, x), (_, y)) in zip(observed, fused):
+            self.assertAlmostEqual(x, y, places=14)
+
+    def testSnapshot_ReadOnlyAndBackpressure(self):
+        release = threading.Event()
+        seen = []
+
+        def slow(s):
+            self.assertRaises(ValueError, s.r.__setitem__, 0, 0.)
+            release.wait()
+            seen.append(s.step)
+
+        obs = nbody_observers.Observers([slow], pending=2, drop=True)
+        for step in range(5):
+            obs.observe(step, 0., self.bodies)
+        self.assertEqual(obs.dropped, 3)
+        release.set()
+        obs.close()
+        self.assertEqual(sorted(seen), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
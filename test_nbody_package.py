@@ -0,0 +1,127 @@
+import os
+import unittest
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import nbody
+import nbody_numpy
+from nbody import backends, initial, server
+
+
+class testBackends(unittest.TestCase):
+    def testReferenceApi_StillExported(self):
+        self.assertIn('sun', nbody.BODIES)
+        self.assertTrue(callable(nbody.nbody))
+
+    def testState_RoundTrip(self):
+        state = nbody.solar_system()
+        copy = nbody.State.from_bodies(state.to_bodies())
+        self.assertEqual(copy.names, state.names)
+        self.assertTrue((copy.r == state.r).all() and (copy.v == state.v).all())
+
+    def testBackends_Agree(self):
+        energies = {}
+        for name in backends.available():
+            energies[name] = backends.run(name, nbody.solar_system(), 2, 200)
+        self.assertIn('numpy', energies)
+        for (name, e) in energies.items():
+            # mixed computes the pair terms in float32
+            places = 6 if name == 'mixed' else 12
+            for (x, y) in zip(e, energies['numpy']):
+                self.assertAlmostEqual(x, y, places=places, msg=name)
+
+    def testFastest_IsAvailable(self):
+        self.assertIn(backends.fastest(5), backends.available())
+        self.assertRaises(ValueError, backends.get, 'missing')
+
+    def testCli(self):
+        out = subprocess.check_output([sys.executable, '-m', 'nbody', '--backend', 'opt',
+                                       '--loops', '2', '--iterations', '10'],
+                                      stderr=subprocess.DEVNULL)
+        self.assertEqual(len(out.split()), 2)
+
+
+class testInitial(unittest.TestCase):
+    def testGenerators_CenterOfMassFrame(self):
+        for kind in ('plummer', 'cube', 'disk', 'solar+test'):
+            state = initial.generate(kind, 500, seed=0)
+            self.assertEqual(len(state), 500, kind)
+            self.assertTrue(np.allclose(np.sum(state.v * state.m[:, None], axis=0), 0.), kind)
+        self.assertEqual(len(initial.generate('solar+test', 5)), 5)
+        with self.assertRaises(ValueError):
+            initial.generate('solar+test', 4)
+
+    def testPlummer_Virial(self):
+        state = initial.plummer(2000, seed=1)
+        (a, potential) = nbody_numpy.accelerations(state, nbody_numpy.make_pairs(2000),
+                                                   potential=True)
+        kinetic = np.sum(state.m * np.einsum('ij,ij->i', state.v, state.v)) / 2.
+        self.assertAlmostEqual(2. * kinetic / -potential, 1., delta=0.05)
+
+    def testLoadSave_RoundTrip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            for (state, name) in ((nbody.solar_system(), 'solar.csv'),
+                                  (initial.cold_disk(100, seed=0), 'disk.npy')):
+                path = os.path.join(tmp, name)
+                initial.save(state, path)
+                loaded = initial.load(path)
+                self.assertTrue((loaded.r == state.r).all() and (loaded.v == state.v).all())
+                self.assertTrue((loaded.m == state.m).all())
+            self.assertEqual(loaded.names, range(100))
+            self.assertEqual(initial.load(os.path.join(tmp, 'solar.csv')).names,
+                             nbody.solar_system().names)
+
+
+class testServer(unittest.TestCase):
+    def testSubmit_StreamsEnergies(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'nbody.sock')
+            proc = subprocess.Popen([sys.executable, '-m', 'nbody.server', 'serve',
+                                     '--socket', path, '--workers', '1'],
+                                    stderr=subprocess.DEVNULL)
+            try:
+                for _ in range(600):
+                    if os.path.exists(path) or proc.poll() is not None:
+                        break
+                    time.sleep(0.1)
+                spec = {'backend': 'numpy', 'loops': 2, 'iterations': 200}
+                events = list(server.request({'op': 'submit', 'spec': spec}, path))
+                self.assertEqual([e['event'] for e in events],
+                                 ['queued', 'started', 'progress', 'progress', 'done'])
+                expected = backends.run('numpy', nbody.solar_system(), 2, 200)
+                self.assertEqual([e['energy'] for e in events[2:4]], expected)
+
+                for bad in ({'op': 'submit', 'spec': {'loops': 0}}, {'op': 'submit', 'spec': 5},
+                            [1], {'op': 'watch', 'job': [1]}):
+                    (error,) = server.request(bad, path)
+                    self.assertEqual(error['event'], 'error', bad)
+            finally:
+                proc.terminate()
+                proc.wait()
+
+    def testValidate_RejectsBadSpecs(self):
+        for spec in ({'loops': True}, {'loops': 0}, {'dt': 0}, {'dt': float('nan')},
+                     {'dt': '0.01'}, {'seed': -1}, {'backend': 'nope'}, {'steps': 1}, 5,
+                     ['loops']):
+            with self.assertRaises(ValueError, msg=spec):
+                server.validate(spec)
+        self.assertEqual(server.validate({'dt': 1, 'loops': 2})['loops'], 2)
+
+    def testHistory_KeepsLastFinishedJobs(self):
+        jobs = server.JobServer(1, keep=2)
+        try:
+            for _ in range(4):
+                job = jobs.submit(server.validate({}))
+                jobs.publish(job, {'event': 'done'})
+            self.assertEqual(sorted(jobs.history), [3, 4])
+            self.assertEqual(sorted(jobs.watchers), [3, 4])
+        finally:
+            jobs.pool.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
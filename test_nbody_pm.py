@@ -0,0 +1,36 @@
+import unittest
+
+import numpy as np
+
+import nbody_numpy
+import nbody_pm
+
+
+class testParticleMesh(unittest.TestCase):
+    def setUp(self):
+        rng = np.random.default_rng(0)
+        r = rng.normal(size=(2000, 3))
+        self.bodies = (r, np.zeros_like(r), rng.uniform(0.5, 1.5, 2000))
+        r = rng.uniform(0., 10., (2000, 3))
+        self.periodic = (r, np.zeros_like(r), rng.uniform(0.5, 1.5, 2000))
+
+    def testIsolated_MatchesDirect(self):
+        direct = nbody_numpy.accelerations(self.bodies, nbody_numpy.make_pairs(2000))
+        a = nbody_pm.accelerations(self.bodies, grid=64)
+        err = np.linalg.norm(a - direct, axis=1) / np.linalg.norm(direct, axis=1)
+        self.assertLess(np.median(err), 0.05)
+
+    def testMomentumConserved(self):
+        for (bodies, box) in ((self.bodies, None), (self.periodic, 10.)):
+            (r, v, m) = (x.copy() for x in bodies)
+            for _ in range(5):
+                nbody_pm.advance((r, v, m), None, 0.01, grid=32, box=box)
+            a = nbody_pm.accelerations((r, v, m), grid=32, box=box)
+            force = m[:, None] * a
+            self.assertLess(np.abs(force.sum(axis=0)).max(), 1e-12 * np.abs(force).sum(), box)
+            self.assertLess(np.abs((m[:, None] * v).sum(axis=0)).max(),
+                            1e-12 * np.abs(m[:, None] * v).sum(), box)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,46 @@
+import unittest
+import os
+from multiprocessing import shared_memory
+
+import numpy as np
+
+import nbody_numpy
+from nbody_opt import BODIES
+from nbody_shm import SharedSystem
+
+
+class testSharedSystem(unittest.TestCase):
+    def setUp(self):
+        self.names, self.bodies = nbody_numpy.arrays_from_bodies(BODIES)
+        nbody_numpy.offset_momentum(self.bodies, 0)
+        self.pairs = nbody_numpy.make_pairs(len(self.names))
+
+    def testAdvance_MatchesNumpy(self):
+        with SharedSystem(self.bodies, workers=2) as system:
+            system.advance(60, 0.01)
+            system.advance(40, 0.01)
+            (r, v, m) = (x.copy() for x in system.bodies)
+        for _ in range(100):
+            nbody_numpy.advance(self.bodies, self.pairs, 0.01)
+        self.assertTrue(np.allclose(r, self.bodies[0], rtol=1e-12, atol=1e-12))
+        self.assertTrue(np.allclose(v, self.bodies[1], rtol=1e-12, atol=1e-12))
+
+    def testDeadWorker_Raises(self):
+        system = SharedSystem(self.bodies, workers=2)
+        name = system.shm.name
+        system.procs[0].kill()
+        with self.assertRaises(RuntimeError):
+            system.advance(10, 0.01)
+        system.close()
+        with self.assertRaises(FileNotFoundError):
+            shared_memory.SharedMemory(name=name)
+
+    def testInitFailure_Unlinks(self):
+        before = set(os.listdir('/dev/shm'))
+        with self.assertRaises(ValueError):
+            SharedSystem((np.zeros((5, 3)), np.zeros((4, 3)), np.ones(5)))
+        self.assertEqual(set(os.listdir('/dev/shm')), before)
+
+
+if __name__ == '__main__':
+    unittest.main()
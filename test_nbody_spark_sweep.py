@@ -0,0 +1,34 @@
+import unittest
+
+import nbody_spark_sweep
+
+
+class testSweep(unittest.TestCase):
+    def testPartition_IndependentOfGrouping(self):
+        records = nbody_spark_sweep.grid((1e-4,), (0.04,), ('euler', 'leapfrog'), members=3)
+        together = list(nbody_spark_sweep.run_partition(records, years=.4))
+        alone = [row for record in records[::-1]
+                 for row in nbody_spark_sweep.run_partition([record], years=.4)]
+        for (x, y) in zip(sorted(together), sorted(alone)):
+            self.assertEqual(x[:4], y[:4])
+            self.assertAlmostEqual(x[4] / y[4], 1., places=6)
+
+    def testSummarize(self):
+        rows = [(1e-4, 0.04, 'euler', 0, 1e-3, 0.5), (1e-4, 0.04, 'euler', 1, 3e-3, 0.5),
+                (1e-2, 0.04, 'euler', 2, 2e-3, 0.5), (1e-4, 0.04, 'leapfrog', 3, 1e-6, 0.25)]
+        self.assertEqual(nbody_spark_sweep.summarize(rows),
+                         [(1e-4, 0.04, 'euler', 2, 2e-3, 3e-3, 1.),
+                          (1e-4, 0.04, 'leapfrog', 1, 1e-6, 1e-6, 0.25),
+                          (1e-2, 0.04, 'euler', 1, 2e-3, 2e-3, 0.5)])
+
+    def testSummarize_TimeSharedByCells(self):
+        records = nbody_spark_sweep.grid((1e-4, 1e-2), (0.04,), ('leapfrog',), members=2)
+        rows = list(nbody_spark_sweep.run_partition(records, years=.4))
+        summary = nbody_spark_sweep.summarize(rows)
+        self.assertEqual(len(summary), 2)
+        self.assertAlmostEqual(summary[0][6], summary[1][6])
+        self.assertAlmostEqual(summary[0][6] + summary[1][6], sum(row[5] for row in rows))
+
+
+if __name__ == '__main__':
+    unittest.main()
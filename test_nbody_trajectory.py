@@ -0,0 +1,81 @@
+import unittest
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+import nbody_numpy
+from nbody_trajectory import TrajectoryWriter, open_trajectory
+
+
+class testTrajectory(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir.name, name)
+
+    def testRoundTrip(self):
+        frames = np.random.default_rng(0).standard_normal((10, 4, 3))
+        # chunk and buffers small enough that the ring wraps and blocks
+        with TrajectoryWriter(self.path('t.npy'), 4, chunk=3, buffers=2) as writer:
+            for (step, r) in enumerate(frames):
+                writer.snapshot(r, step, step * 0.5)
+
+        (data, index) = open_trajectory(self.path('t.npy'))
+        self.assertEqual(data.shape, (10, 4, 3))
+        self.assertTrue((data == frames).all())
+        self.assertEqual(list(index['step']), list(range(10)))
+        self.assertEqual(list(index['time']), [step * 0.5 for step in range(10)])
+
+    def testEvery(self):
+        with TrajectoryWriter(self.path('t.npy'), 2, every=4, chunk=2) as writer:
+            for step in range(11):
+                writer.snapshot(np.full((2, 3), step), step, step)
+
+        (data, index) = open_trajectory(self.path('t.npy'))
+        self.assertEqual(list(index['step']), [0, 4, 8])
+        self.assertEqual(list(data[:, 0, 0]), [0., 4., 8.])
+
+    def testResume_Appends(self):
+        nbody_numpy.nbody(2, 'sun', 50, checkpoint=self.path('part.ckpt'),
+                          trajectory=self.path('part.npy'), every=10)
+        # frames past the checkpoint, as if the run was killed after writing them
+        with TrajectoryWriter(self.path('part.npy'), 5, every=10, resume=100) as writer:
+            writer.snapshot(np.zeros((5, 3)), 110, 1.1)
+        nbody_numpy.nbody(4, 'sun', 50, resume=self.path('part.ckpt'),
+                          trajectory=self.path('part.npy'), every=10)
+        nbody_numpy.nbody(4, 'sun', 50, trajectory=self.path('full.npy'), every=10)
+
+        (part, part_index) = open_trajectory(self.path('part.npy'))
+        (full, full_index) = open_trajectory(self.path('full.npy'))
+        self.assertEqual(list(part_index['step']), list(range(0, 201, 10)))
+        self.assertTrue((part_index == full_index).all())
+        self.assertTrue((part == full).all())
+
+    def testResume_AfterKillBeforeClose(self):
+        # the process dies after the last checkpoint, before the writer is closed
+        subprocess.check_call([sys.executable, '-c', '''if True:
+            import os, sys
+            import nbody_numpy, nbody_trajectory
+            nbody_trajectory.TrajectoryWriter.close = lambda self: os._exit(0)
+            nbody_numpy.nbody(2, 'sun', 50, checkpoint=sys.argv[1], trajectory=sys.argv[2],
+                              every=10)
+            ''', self.path('part.ckpt'), self.path('part.npy')], stdout=subprocess.DEVNULL)
+        nbody_numpy.nbody(4, 'sun', 50, resume=self.path('part.ckpt'),
+                          trajectory=self.path('part.npy'), every=10)
+        nbody_numpy.nbody(4, 'sun', 50, trajectory=self.path('full.npy'), every=10)
+
+        (part, part_index) = open_trajectory(self.path('part.npy'))
+        (full, full_index) = open_trajectory(self.path('full.npy'))
+        self.assertTrue((part_index == full_index).all())
+        self.assertTrue((part == full).all())
+
+
+if __name__ == '__main__':
+    unittest.main()